@@ -0,0 +1,217 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+from telemetry_log import TelemetryLog
+
+# --- 1. CONFIGURATION ---
+# Decides how a quiz request is cut into LLM calls: how many questions per call and whether
+# types of the same difficulty share a call. Each call is costed with the telemetry of the model
+# it is routed to, and only types routed to the same model are mixed.
+TELEMETRY_FILE = "data/batch_telemetry.jsonl"
+CALL_SIZES = [2, 3, 4, 5, 6, 8, 10, 15]   # Max questions per call the planner tries
+MIN_SAMPLES = 5                           # Below this, the default profile is used
+TELEMETRY_WINDOW = 2000                   # Recent calls kept per model (the fit follows current behaviour)
+TELEMETRY_TAIL_BYTES = 2_000_000          # Only the end of the file is read back at startup
+
+# Starting point before anything is measured (rough numbers for a 14B model on one GPU)
+DEFAULT_OVERHEAD_S = 6.0        # Prompt eval + JSON framing, paid once per call
+DEFAULT_PER_QUESTION_S = 4.0
+DEFAULT_KEEP_RATE = 0.9         # Share of requested questions that validate
+PRIOR_WEIGHT = 10               # Pseudo-questions of the default keep rate (smooths sparse data)
+
+@dataclass
+class BatchSpec:
+    """One LLM call: a difficulty, the (type, count) parts it should produce and the model it goes to."""
+    difficulty: str
+    parts: List[Tuple[str, int]]
+    model: str = ""
+
+    @property
+    def total(self) -> int:
+        return sum(count for _, count in self.parts)
+
+    @property
+    def mixed(self) -> bool:
+        return len(self.parts) > 1
+
+    @property
+    def label(self) -> str:
+        return f"{self.difficulty}/" + "+".join(f"{t}x{n}" for t, n in self.parts)
+
+@dataclass
+class BatchPlan:
+    batches: List[BatchSpec]
+    max_questions_per_call: int
+    combine_types: bool
+    estimated_seconds: float
+
+# --- 2. TELEMETRY ---
+telemetry_log = TelemetryLog(TELEMETRY_FILE, tail_bytes=TELEMETRY_TAIL_BYTES)
+_telemetry_lock = threading.Lock()
+_entries: Dict[str, deque] = defaultdict(lambda: deque(maxlen=TELEMETRY_WINDOW))  # model -> recent calls
+_profiles: Dict[str, "ModelProfile"] = {}              # model -> fit, dropped when new calls arrive
+
+def record_attempt(model: str, spec: BatchSpec, requested: int, kept: int, seconds: float):
+    """One line per LLM call (first attempts and salvage top-ups alike)."""
+    telemetry_log.append({
+        "timestamp": time.time(),
+        "model": model,
+        "difficulty": spec.difficulty,
+        "types": len(spec.parts),
+        "requested": requested,
+        "kept": kept,
+        "seconds": round(seconds, 3),
+    })
+
+def _refresh():
+    """Folds in the calls logged since the last plan. Called with _telemetry_lock held."""
+    entries, reset = telemetry_log.read_new()
+    if reset:
+        _entries.clear()
+        _profiles.clear()
+    for e in entries:
+        _entries[e["model"]].append(e)
+        _profiles.pop(e["model"], None)
+
+def load_telemetry(model: str) -> List[dict]:
+    with _telemetry_lock:
+        _refresh()
+        return list(_entries[model])
+
+# --- 3. COST MODEL ---
+def _size_bucket(n: int) -> int:
+    return 0 if n <= 3 else 1 if n <= 6 else 2
+
+@dataclass
+class ModelProfile:
+    model: str
+    overhead_s: float = DEFAULT_OVERHEAD_S
+    per_question_s: float = DEFAULT_PER_QUESTION_S
+    keep: Dict[Tuple[int, bool], Tuple[float, float]] = field(default_factory=dict)  # (bucket, mixed) -> (kept, requested)
+    samples: int = 0
+
+    def call_seconds(self, n: int) -> float:
+        return self.overhead_s + self.per_question_s * n
+
+    def keep_rate(self, n: int, mixed: bool) -> float:
+        kept, requested = self.keep.get((_size_bucket(n), mixed), (0.0, 0.0))
+        return (kept + DEFAULT_KEEP_RATE * PRIOR_WEIGHT) / (requested + PRIOR_WEIGHT)
+
+    def expected_seconds(self, spec: BatchSpec) -> float:
+        """One call plus the expected salvage top-up for the questions that don't validate."""
+        keep = self.keep_rate(spec.total, spec.mixed)
+        # A top-up call happens if ANY question fails (1 - keep^n) and regenerates the expected shortfall
+        top_up = (1 - keep ** spec.total) * self.overhead_s + self.per_question_s * spec.total * (1 - keep)
+        return self.call_seconds(spec.total) + top_up
+
+def fit_profile(model: str, entries: List[dict]) -> ModelProfile:
+    profile = ModelProfile(model=model, samples=len(entries))
+    if len(entries) < MIN_SAMPLES:
+        return profile
+
+    # seconds ~ overhead + per_question * requested  (least squares on calls that returned something)
+    points = [(e["requested"], e["seconds"]) for e in entries if e["kept"] > 0]
+    if len(points) >= MIN_SAMPLES:
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if var_x > 0:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+            intercept = mean_y - slope * mean_x
+            if slope > 0 and intercept >= 0:
+                profile.per_question_s, profile.overhead_s = slope, intercept
+
+    keep = defaultdict(lambda: [0.0, 0.0])
+    for e in entries:
+        bucket = keep[(_size_bucket(e["requested"]), e["types"] > 1)]
+        bucket[0] += e["kept"]
+        bucket[1] += e["requested"]
+    profile.keep = {key: tuple(value) for key, value in keep.items()}
+    return profile
+
+def load_profile(model: str) -> ModelProfile:
+    # Every plan sees the latest telemetry; a model is only refitted when it has new calls
+    with _telemetry_lock:
+        _refresh()
+        if model not in _profiles:
+            _profiles[model] = fit_profile(model, _entries[model])
+        return _profiles[model]
+
+# --- 4. PLANNING ---
+def _split(count: int, max_size: int) -> List[int]:
+    """7 with max 3 -> [3, 2, 2] (near-equal pieces, so no tiny straggler call); 0 -> []."""
+    if count <= 0:
+        return []
+    pieces = math.ceil(count / max_size)
+    base, extra = divmod(count, pieces)
+    return [base + 1 if i < extra else base for i in range(pieces)]
+
+# model_for(q_type, difficulty) -> the model that type is routed to (model_router.quiz_model)
+ModelFor = Callable[[str, str], str]
+
+def candidate_batches(quiz_config, max_size: int, combine_types: bool, model_for: ModelFor) -> List[BatchSpec]:
+    batches = []
+    for config in quiz_config:
+        type_reqs = [type_req for type_req in config.quiz_type_config if type_req.number > 0]
+        if not combine_types:
+            for type_req in type_reqs:
+                model = model_for(type_req.type, config.difficulty)
+                batches += [BatchSpec(config.difficulty, [(type_req.type, n)], model)
+                            for n in _split(type_req.number, max_size)]
+            continue
+
+        # Only types routed to the same model share a call (an easy type must not ride along
+        # to the large model). Within a group, calls are filled up to max_size and a type may
+        # continue into the next call.
+        groups: Dict[str, list] = {}
+        for type_req in type_reqs:
+            groups.setdefault(model_for(type_req.type, config.difficulty), []).append(type_req)
+        for model, group in groups.items():
+            total = sum(type_req.number for type_req in group)
+            remaining = [[type_req.type, type_req.number] for type_req in group]
+            for size in _split(total, max_size):
+                parts = []
+                while size > 0:
+                    q_type, left = remaining[0]
+                    take = min(left, size)
+                    parts.append((q_type, take))
+                    size -= take
+                    remaining[0][1] -= take
+                    if remaining[0][1] == 0:
+                        remaining.pop(0)
+                batches.append(BatchSpec(config.difficulty, parts, model))
+    return [b for b in batches if b.total > 0]
+
+def estimate_makespan(batches: List[BatchSpec], profiles: Dict[str, ModelProfile], max_concurrency: int) -> float:
+    """Wall time with `max_concurrency` slots (longest calls first onto the least busy slot)."""
+    slots = [0.0] * max(1, max_concurrency)
+    for cost in sorted((profiles[b.model].expected_seconds(b) for b in batches), reverse=True):
+        heapq.heappush(slots, heapq.heappop(slots) + cost)
+    return max(slots)
+
+def plan_quiz(quiz_config, model_for: ModelFor, max_concurrency: int) -> BatchPlan:
+    profiles: Dict[str, ModelProfile] = {}
+    best = None
+    for combine_types in (False, True):
+        for max_size in CALL_SIZES:
+            batches = candidate_batches(quiz_config, max_size, combine_types, model_for)
+            for batch in batches:
+                if batch.model not in profiles:
+                    profiles[batch.model] = load_profile(batch.model)
+            seconds = estimate_makespan(batches, profiles, max_concurrency)
+            # Ties go to fewer calls (less load on the shared host)
+            score = (round(seconds, 1), len(batches))
+            if best is None or score < best[0]:
+                best = (score, BatchPlan(batches, max_size, combine_types, seconds))
+
+    plan = best[1]
+    source = ", ".join(f"{model}: {p.samples} measured calls" if p.samples >= MIN_SAMPLES else f"{model}: defaults"
+                       for model, p in profiles.items())
+    print(f"🧮 Plan ({source or 'nothing requested'}): {len(plan.batches)} calls, "
+          f"<= {plan.max_questions_per_call} questions each, "
+          f"{'mixed' if plan.combine_types else 'one type per call'}, ~{plan.estimated_seconds:.0f}s")
+    return plan
@@ -0,0 +1,36 @@
+import os
+from typing import List
+from sentence_transformers import SentenceTransformer
+
+# --- 1. CONFIGURATION ---
+# Our ingestion nodes are CPU-only, so the backend is selectable:
+#   - "torch"     : the original PyTorch model (reference output)
+#   - "onnx"      : ONNX Runtime export of the same weights (fp32)
+#   - "onnx-int8" : ONNX Runtime with dynamic int8 quantization
+# The ONNX backends need the "onnx" extra: `uv sync --extra onnx` (sentence-transformers[onnx]).
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# Pre-exported int8 file shipped in the model repo (AVX2 runs on every x86 box we have)
+INT8_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+# --- 2. LOADER ---
+def load_embedder(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL) -> SentenceTransformer:
+    """
+    Returns a SentenceTransformer for the given backend.
+    Every backend exposes the same `.encode(sentences)` the splitter uses.
+    """
+    if backend == "torch":
+        return SentenceTransformer(model_name, backend="torch")
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": INT8_ONNX_FILE})
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of {BACKENDS}.")
+
+# --- 3. SHARED SENTENCE SPLIT ---
+def split_sentences(text: str) -> List[str]:
+    """Same naive sentence split the semantic splitter has always used."""
+    return [s.strip() for s in text.replace('\n', ' ').split('.') if len(s) > 10]
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional
+import numpy as np
+
+# --- 1. CONFIGURATION ---
+# Cosine similarity above which two generated items say the same thing in different words
+# (exact-text checks miss "What is X?" vs "Define X.").
+DUPLICATE_SIMILARITY = 0.9
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    # Loaded on first use: importing this module must not pull the model into every script
+    from embedder import load_embedder
+    return load_embedder()
+
+def embed(texts: List[str]) -> np.ndarray:
+    return np.asarray(get_encoder().encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+# --- 2. GUARD ---
+class DedupGuard:
+    """
+    Accepted-so-far embeddings for one quiz / deck, seeded with the items already saved in the course.
+    Plugged into salvage (`dedup=`): screen() drops near-duplicates before they are kept, so the
+    shortfall is regenerated by the normal retry; admit() records what was finally kept.
+    One guard is shared by all parallel batches (tasks or threads), which is what catches
+    cross-batch paraphrases. Async callers use ascreen(): encoding (and the first model load)
+    runs in a worker thread instead of blocking the event loop.
+    """
+
+    def __init__(self, text_of: Callable, saved_texts: Iterable[str] = (), threshold: float = DUPLICATE_SIMILARITY):
+        self.text_of = text_of
+        self.threshold = threshold
+        self.rejected = 0
+        self._lock = threading.Lock()       # accepted / _pending / rejected
+        self._seed_lock = threading.Lock()  # Saved items are embedded once, on first use
+        self._saved_texts = list(saved_texts)
+        self.accepted: Optional[np.ndarray] = None
+        self._pending = {}  # id(item) -> (item, vector), between screen() and admit() of the same batch
+
+    def _embed(self, items: List) -> np.ndarray:
+        with self._seed_lock:
+            if self._saved_texts:
+                saved = embed(self._saved_texts)
+                with self._lock:
+                    self.accepted = saved if self.accepted is None else np.vstack([saved, self.accepted])
+                self._saved_texts = []
+        return embed([self.text_of(item) for item in items])
+
+    def screen(self, items: List) -> List:
+        if not items:
+            return []
+        return self._keep_distinct(items, self._embed(items))
+
+    async def ascreen(self, items: List) -> List:
+        if not items:
+            return []
+        return self._keep_distinct(items, await asyncio.to_thread(self._embed, items))
+
+    def _keep_distinct(self, items: List, vectors: np.ndarray) -> List:
+        with self._lock:
+            # One matrix product against everything accepted, one within the new batch
+            if self.accepted is not None and len(self.accepted):
+                closest_accepted = (vectors @ self.accepted.T).max(axis=1)
+            else:
+                closest_accepted = np.zeros(len(items), dtype=np.float32)
+            within = vectors @ vectors.T
+
+            kept = []
+            for i in range(len(items)):
+                if closest_accepted[i] >= self.threshold or any(within[i, j] >= self.threshold for j in kept):
+                    continue
+                kept.append(i)
+            self.rejected += len(items) - len(kept)
+            for i in kept:
+                self._pending[id(items[i])] = (items[i], vectors[i])  # Holding the item keeps its id unique
+        return [items[i] for i in kept]
+
+    def admit(self, items: List, screened: List = ()):
+        """items: what the batch kept; screened: what screen() returned for it (the rest is forgotten).
+        Only this batch's entries are touched, so batches on other threads keep theirs."""
+        with self._lock:
+            vectors = [self._pending.pop(id(item))[1] for item in items if id(item) in self._pending]
+            for item in screened:
+                self._pending.pop(id(item), None)
+            if vectors:
+                stacked = np.vstack(vectors)
+                self.accepted = stacked if self.accepted is None else np.vstack([self.accepted, stacked])
+
+# --- 3. TEXT KEYS ---
+def question_key(question) -> str:
+    # Options are part of the key: statement_verification questions share the same stem
+    return question.question_text + " " + " ".join(option.text for option in question.options)
+
+def card_key(card) -> str:
+    return card.front_text
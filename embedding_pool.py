@@ -0,0 +1,82 @@
+import os
+import multiprocessing as mp
+import numpy as np
+from typing import List, Optional
+
+# --- 1. WORKER SIDE ---
+# Each worker process loads the model ONCE and keeps it for the life of the pool.
+# `embedder` is imported lazily so the thread limits below are set before torch/onnxruntime start.
+_worker_embedder = None
+
+def _init_worker(backend: str, threads_per_worker: int):
+    global _worker_embedder
+    os.environ["OMP_NUM_THREADS"] = str(threads_per_worker)
+    os.environ["MKL_NUM_THREADS"] = str(threads_per_worker)
+
+    from embedder import load_embedder
+    _worker_embedder = load_embedder(backend)
+
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(threads_per_worker)
+
+def _encode_batch(sentences: List[str]) -> np.ndarray:
+    return _worker_embedder.encode(sentences, batch_size=len(sentences))
+
+# --- 2. THE POOL ---
+class EmbeddingPool:
+    """
+    N worker processes sharing the sentence-encoding load.
+    Exposes the same `.encode(sentences)` as a single embedder, so it can be passed to the splitter.
+    Create it once per ingestion run and reuse it for every document.
+    """
+
+    def __init__(self, num_workers: Optional[int] = None, backend: Optional[str] = None, batch_size: int = 64):
+        from embedder import EMBEDDING_BACKEND
+
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.backend = backend or EMBEDDING_BACKEND
+        self.batch_size = batch_size
+
+        # Split the cores between workers so they don't oversubscribe each other
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        # "spawn" gives every worker a clean interpreter (fork + torch threads can deadlock)
+        ctx = mp.get_context("spawn")
+        self._pool = ctx.Pool(
+            processes=self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.backend, threads_per_worker),
+        )
+        self._closed = False
+        print(f"🏊 Embedding pool started: {self.num_workers} workers x {threads_per_worker} threads ({self.backend})")
+
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        if self._closed:
+            raise RuntimeError("EmbeddingPool has been shut down.")
+        if not sentences:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Shard into batches; Pool.map returns them in submission order
+        batches = [sentences[i:i + self.batch_size] for i in range(0, len(sentences), self.batch_size)]
+        results = self._pool.map(_encode_batch, batches, chunksize=1)
+        return np.vstack(results)
+
+    def shutdown(self, wait: bool = True):
+        """Graceful shutdown: finish in-flight batches, then stop the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        if wait:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+        print("🏁 Embedding pool shut down.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Don't wait on queued work if we're unwinding from an error
+        self.shutdown(wait=exc_type is None)
@@ -0,0 +1,94 @@
+import json
+import os
+import numpy as np
+from typing import Optional, Tuple
+
+# --- 1. CONFIGURATION ---
+# On-disk layout of one store (a directory):
+#   meta.json    -> {"format": ..., "dim": ..., "count": ...}
+#   vectors.npy  -> float32 / float16 / int8 matrix (count x dim), memory-mapped on read
+#   scales.npy   -> float32 per-vector scale (int8 only)
+FORMATS = ["float32", "float16", "int8"]
+BLOCK_ROWS = 65536  # Rows dequantized at a time during a scan
+
+# --- 2. QUANTIZATION ---
+def quantize(vectors: np.ndarray, fmt: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Returns (codes, scales). Scales are only meaningful for int8."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if fmt == "float32":
+        return vectors, None
+    if fmt == "float16":
+        return vectors.astype(np.float16), None
+    if fmt == "int8":
+        # Symmetric per-vector scale: the largest |component| maps to 127
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown storage format '{fmt}'. Choose one of {FORMATS}.")
+
+def save_embeddings(path: str, vectors: np.ndarray, fmt: str = "int8", normalize: bool = True):
+    """Writes a store. Vectors are L2-normalized by default so dot product == cosine."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if normalize:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+    codes, scales = quantize(vectors, fmt)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "vectors.npy"), codes)
+    if scales is not None:
+        np.save(os.path.join(path, "scales.npy"), scales)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": fmt, "dim": int(vectors.shape[1]), "count": int(vectors.shape[0])}, f, indent=2)
+
+# --- 3. READER ---
+class EmbeddingStore:
+    """
+    Memory-mapped reader. Nothing is loaded up front; rows are dequantized
+    block by block while computing dot products.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.format = meta["format"]
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.codes = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.format == "int8" else None
+
+    def __len__(self):
+        return self.count
+
+    def nbytes(self) -> int:
+        total = os.path.getsize(os.path.join(self.path, "vectors.npy"))
+        if self.scales is not None:
+            total += os.path.getsize(os.path.join(self.path, "scales.npy"))
+        return total
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """Scores every stored vector against one query (or a matrix of queries: dim x Q)."""
+        query = np.asarray(query, dtype=np.float32)
+        scores = []
+        for start in range(0, self.count, BLOCK_ROWS):
+            block = np.asarray(self.codes[start:start + BLOCK_ROWS], dtype=np.float32)
+            block_scores = block @ query
+            if self.scales is not None:
+                # (codes * s) @ q == (codes @ q) * s  -> scale after the matmul
+                scale = np.asarray(self.scales[start:start + BLOCK_ROWS])
+                block_scores = block_scores * (scale if block_scores.ndim == 1 else scale[:, None])
+            scores.append(block_scores)
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+    def search(self, query: np.ndarray, k: int = 10) -> np.ndarray:
+        """Indices of the top-k vectors by dot product (cosine for normalized stores)."""
+        scores = self.dot(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
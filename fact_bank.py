@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from poc_15_gen_quiz_v3 import (
+    EXTRACT_CHUNK_TOKENS, EXTRACT_MODEL, EXTRACT_OUTPUT_TOKENS, KeyConcept, step_1_extract_concepts,
+)
+from poc_21_map_reduce_notes import estimate_tokens, split_into_chunks
+from topic_dedup import topic_index, topic_key
+
+# --- 1. CONFIGURATION ---
+# Facts are extracted once when a course is saved; quiz/deck generation then prompts
+# from this compact list instead of re-sending the full raw_text every time.
+BANK_FILE = os.getenv("FACT_BANK_FILE", "data/fact_bank.sqlite")
+TOKENS_PER_FACT = 60        # Roughly one atomic fact per short paragraph
+MIN_FACTS, MAX_FACTS_PER_CHUNK = 5, 40
+DUPLICATE_JACCARD = 0.8     # Word overlap above which two facts count as the same
+MAX_WORKERS = 2             # Background extraction jobs (shares Ollama with live requests)
+
+def content_hash(raw_text: str) -> str:
+    return hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+
+# --- 2. EXTRACTION ---
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+def dedupe_facts(concepts: List[KeyConcept]) -> List[KeyConcept]:
+    kept, kept_words = [], []
+    for concept in concepts:
+        words = _words(concept.fact_content)
+        if not words:
+            continue
+        if any(len(words & other) / len(words | other) >= DUPLICATE_JACCARD for other in kept_words):
+            continue
+        kept.append(concept)
+        kept_words.append(words)
+    for i, concept in enumerate(kept):
+        concept.concept_id = i + 1
+    return kept
+
+def extract_topic_facts(raw_text: str) -> List[KeyConcept]:
+    """Chunked to the extraction window (EXTRACT_NUM_CTX); count scales with the text length."""
+    concepts = []
+    for chunk in split_into_chunks(raw_text, EXTRACT_CHUNK_TOKENS, model=EXTRACT_MODEL,
+                                   output_tokens=EXTRACT_OUTPUT_TOKENS):
+        count = min(MAX_FACTS_PER_CHUNK, max(MIN_FACTS, estimate_tokens(chunk, EXTRACT_MODEL) // TOKENS_PER_FACT))
+        concepts.extend(step_1_extract_concepts(chunk, count=count))
+    return dedupe_facts(concepts)
+
+def render_facts(concepts: List[KeyConcept]) -> str:
+    """Prompt-ready replacement for topicContent."""
+    return "\n".join(f"{c.concept_id}. {c.fact_content}" for c in concepts)
+
+# --- 3. THE BANK ---
+class FactBank:
+    """
+    One row per topic id -> (content_hash, title, concepts). A topic is re-extracted only
+    when its raw_text hash changes; removed topics are dropped on the next course save.
+    Generation looks facts up by the hash of the text it was given (see with_facts).
+    """
+
+    def __init__(self, path: str = BANK_FILE, max_workers: int = MAX_WORKERS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fact-bank")
+        self._pending: Dict[str, Future] = {}
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:  # Created on first write, so a process that never extracts leaves no file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS facts (
+                    topic_key TEXT PRIMARY KEY,
+                    course_id INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    concepts TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_hash ON facts(content_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_facts_course ON facts(course_id)")
+            self._ready = True
+        return conn
+
+    def _query(self, sql: str, params: tuple) -> list:
+        if not self._ready and not os.path.exists(self.path):
+            return []  # Nothing extracted yet: every lookup misses
+        with self._lock, self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    # Course save hook (POST /courses, PUT /courses/{id}/content)
+    def on_course_saved(self, course_id: int, topics: List[dict]) -> List[Future]:
+        """Returns immediately; changed topics are extracted in the background."""
+        keys = {topic_key(topic) for topic in topics}
+        stored = dict(self._query("SELECT topic_key, content_hash FROM facts WHERE course_id = ?", (course_id,)))
+        removed = [key for key in stored if key not in keys]
+        if removed:
+            with self._lock, self._connect() as conn:
+                conn.executemany("DELETE FROM facts WHERE topic_key = ?", [(key,) for key in removed])
+
+        jobs = []
+        for topic in topics:
+            key = topic_key(topic)
+            digest = content_hash(topic["raw_text"])
+            if stored.get(key) == digest:
+                continue
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is not None and getattr(pending, "content_hash", None) == digest:
+                    jobs.append(pending)  # Same text already being extracted
+                    continue
+                future = self._executor.submit(self._extract, course_id, key, topic["title"], topic["raw_text"], digest)
+                future.content_hash = digest
+                self._pending[key] = future
+            jobs.append(future)
+
+        print(f"🏦 Course {course_id}: {len(jobs)} topics queued for fact extraction, "
+              f"{len(topics) - len(jobs)} unchanged, {len(removed)} removed")
+        return jobs
+
+    def _extract(self, course_id: int, key: str, title: str, raw_text: str, digest: str):
+        start_time = time.time()
+        try:
+            concepts = extract_topic_facts(raw_text)
+            with self._lock:
+                # A newer save may have replaced the text while we were extracting
+                stale = getattr(self._pending.get(key), "content_hash", digest) != digest
+                if not stale and concepts:
+                    with self._connect() as conn:  # One row per topic: nothing else is rewritten
+                        conn.execute(
+                            "INSERT OR REPLACE INTO facts (topic_key, course_id, content_hash, title, concepts, "
+                            "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, course_id, digest, title,
+                             json.dumps([c.model_dump() for c in concepts], ensure_ascii=False), time.time()),
+                        )
+        finally:
+            # Also after a failure, so the next course save schedules this topic again
+            with self._lock:
+                if getattr(self._pending.get(key), "content_hash", None) == digest:
+                    del self._pending[key]
+        if not stale and concepts:
+            print(f"   ✅ {title}: {len(concepts)} facts ({time.time() - start_time:.1f}s)")
+        return concepts
+
+    # Lookup
+    def get_facts(self, topic: dict) -> Optional[List[KeyConcept]]:
+        """Facts for the saved topic's CURRENT text, or None (not extracted yet / text changed)."""
+        rows = self._query("SELECT concepts FROM facts WHERE topic_key = ? AND content_hash = ?",
+                           (topic_key(topic), content_hash(topic["raw_text"])))
+        return [KeyConcept(**c) for c in json.loads(rows[0][0])] if rows else None
+
+    def facts_for_text(self, raw_text: str) -> Optional[List[KeyConcept]]:
+        """Same, for callers that only have the text (generation payloads carry topicContent, not ids)."""
+        rows = self._query("SELECT concepts FROM facts WHERE content_hash = ? LIMIT 1", (content_hash(raw_text),))
+        return [KeyConcept(**c) for c in json.loads(rows[0][0])] if rows else None
+
+    def source_text(self, raw_text: str) -> str:
+        """What to put in `topicContent`: the fact list when available, the raw text otherwise."""
+        concepts = self.facts_for_text(raw_text)
+        return render_facts(concepts) if concepts else raw_text
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+# Shared by the course save hook and every generation path
+fact_bank = FactBank()
+
+def on_course_saved(course_id: int, topics: List[dict]) -> List[Future]:
+    """
+    Course save hook (POST /courses, PUT /courses/{id}/content), called with the saved topics
+    (ids assigned): indexes them for cross-course reuse and queues fact extraction.
+    """
+    topic_index.index_course(course_id, topics)
+    return fact_bank.on_course_saved(course_id, topics)
+
+def with_facts(payload):
+    """A generation payload with topicContent swapped for the topic's fact list, if the bank has one."""
+    source = fact_bank.source_text(payload.topicContent)
+    return payload if source is payload.topicContent else payload.model_copy(update={"topicContent": source})
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open("data/ai_list_split.json", "r", encoding="utf-8") as f:
+        sections = json.load(f)
+
+    topics = [{"id": 100 + i, "title": s["title"], "raw_text": s["content"], "order_index": i + 1} for i, s in enumerate(sections[:3])]
+
+    bank = FactBank(path="data/fact_bank_demo.sqlite")
+    for job in bank.on_course_saved(1, topics):
+        job.result()
+
+    # Saving again without edits costs nothing; editing one topic re-extracts only that topic
+    topics[1]["raw_text"] += "\nInstructor note: this section is examined."
+    for job in bank.on_course_saved(1, topics):
+        job.result()
+
+    for topic in topics:
+        source = bank.source_text(topic["raw_text"])
+        print(f"📌 {topic['title']}: {len(topic['raw_text'])} chars raw -> {len(source)} chars of facts")
+    bank.shutdown()
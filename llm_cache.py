@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Type
+from pydantic import BaseModel
+
+# --- 1. CONFIGURATION ---
+CACHE_FILE = os.getenv("LLM_CACHE_FILE", "data/llm_cache.sqlite")
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# --- 2. THE CACHE ---
+class LLMResponseCache:
+    """
+    On-disk cache of VALIDATED structured outputs.
+    Key = model + temperature + prompt hash + output schema, so a changed prompt or schema is a miss.
+    Entries expire after the TTL; beyond max_entries the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # batch() calls us from worker threads
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    schema TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(model: str, temperature: Optional[float], prompt, schema: Type[BaseModel]) -> str:
+        prompt_text = prompt if isinstance(prompt, str) else str(prompt)
+        schema_text = json.dumps(schema.model_json_schema(), sort_keys=True)
+        parts = [
+            model,
+            str(temperature),
+            hashlib.sha256(prompt_text.encode("utf-8")).hexdigest(),
+            schema.__name__,
+            hashlib.sha256(schema_text.encode("utf-8")).hexdigest(),
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return schema.model_validate_json(value)
+
+    def put(self, key: str, value: BaseModel):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, schema, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, type(value).__name__, value.model_dump_json(), now, now),
+            )
+            # LRU eviction
+            conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {"entries": entries, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,170 @@
+import os
+import httpx
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Type
+from langchain_core.runnables import RunnableLambda
+from langchain_ollama import ChatOllama
+from pydantic import BaseModel
+from output_repair import parse_structured
+from llm_cache import LLMResponseCache
+from llm_scheduler import scheduler
+from ollama_pool import OLLAMA_HOSTS, UpstreamPool
+
+# --- 1. CONFIGURATION ---
+# One place for every script to get its Ollama client.
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", OLLAMA_HOSTS[0] if OLLAMA_HOSTS else "http://localhost:11434")
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Keep models loaded between requests
+MAX_CONNECTIONS = 16
+REQUEST_TIMEOUT = 600.0  # Long generations (full decks / quizzes) can take minutes
+
+def _client_kwargs() -> dict:
+    # Passed straight to the underlying httpx client: connections stay open and get reused
+    return {
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=300,
+        ),
+        "timeout": REQUEST_TIMEOUT,
+    }
+
+# Several inference boxes (OLLAMA_HOSTS): schema-constrained calls are spread over them (see ollama_pool.py).
+# A hedge duplicate takes its own scheduler slot, so hedging never exceeds MAX_IN_FLIGHT.
+upstream_pool = UpstreamPool(OLLAMA_HOSTS, hedge_slot=scheduler.aslot) if len(OLLAMA_HOSTS) > 1 else None
+
+# --- 2. CLIENT FACTORY ---
+@lru_cache(maxsize=None)
+def get_llm(model: str, temperature: float = 0.0, num_ctx: Optional[int] = None,
+            base_url: str = OLLAMA_BASE_URL) -> ChatOllama:
+    """
+    Returns the shared ChatOllama for (model, temperature, num_ctx, host).
+    Same arguments -> same instance -> same connection pool.
+    """
+    return ChatOllama(
+        model=model,
+        temperature=temperature,
+        num_ctx=num_ctx,
+        base_url=base_url,
+        keep_alive=KEEP_ALIVE,
+        client_kwargs=_client_kwargs(),
+    )
+
+_structured_runnables = {}
+
+def get_structured_llm(llm: ChatOllama, schema: Type[BaseModel], cache: bool = True):
+    """
+    Cached equivalent of `llm.with_structured_output(schema)`.
+    Binding the schema is not free, so build it once per (model settings, schema) instead of per call.
+    With `cache=True` validated outputs are also stored in the response cache (see FRESH to bypass).
+    Outputs go through output_repair first: trailing commas, truncation, "3" for 3 or NORMAL_MULTIPLE
+    for normal_multiple are fixed locally instead of failing into a full retry.
+    """
+    key = (llm.model, llm.temperature, llm.num_ctx, schema, cache)
+    if key not in _structured_runnables:
+        runnable = get_json_llm(llm, schema) | RunnableLambda(
+            lambda message: parse_structured(message.content, schema), name=f"repair_{schema.__name__}"
+        )
+        _structured_runnables[key] = _with_response_cache(runnable, llm, schema) if cache else runnable
+    return _structured_runnables[key]
+
+_json_runnables = {}
+
+def get_json_llm(llm: ChatOllama, schema: Type[BaseModel]):
+    """
+    Same schema-constrained decoding as get_structured_llm, but returns the raw message,
+    so callers can validate item by item instead of all-or-nothing (see salvage.py).
+    With an upstream pool every call goes to the host picked for it (hedged when slow).
+    Every call first waits for a slot in the process-wide LLM scheduler (llm_scheduler.py).
+    """
+    key = (llm.model, llm.temperature, llm.num_ctx, schema)
+    if key not in _json_runnables:
+        schema_format = schema.model_json_schema()
+        if upstream_pool is None:
+            runnable = llm.bind(format=schema_format)
+        else:
+            per_host = {
+                url: get_llm(llm.model, llm.temperature, llm.num_ctx, base_url=url).bind(format=schema_format)
+                for url in OLLAMA_HOSTS
+            }
+            runnable = upstream_pool.runnable(llm.model, per_host.__getitem__)
+        _json_runnables[key] = _with_scheduler(runnable, schema)
+    return _json_runnables[key]
+
+@lru_cache(maxsize=None)
+def _format_bound(model: str, temperature: float, num_ctx: Optional[int], base_url: str, schema: Type[BaseModel]):
+    return get_llm(model, temperature, num_ctx, base_url).bind(format=schema.model_json_schema())
+
+async def astream_json(llm: ChatOllama, schema: Type[BaseModel], prompt: str) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of get_json_llm: yields the text chunks of one schema-constrained call,
+    inside a scheduler slot and, with an upstream pool, from the host picked for the prompt.
+    """
+    async with scheduler.aslot():
+        if upstream_pool is None:
+            chunks = _format_bound(llm.model, llm.temperature, llm.num_ctx, llm.base_url, schema).astream(prompt)
+        else:
+            chunks = upstream_pool.astream(llm.model, lambda url: _format_bound(
+                llm.model, llm.temperature, llm.num_ctx, url, schema), prompt)
+        async for chunk in chunks:
+            yield chunk.content
+
+def _with_scheduler(runnable, schema: Type[BaseModel]):
+    # Priority and user come from llm_scheduler.request_context (background when unset)
+    def _invoke(prompt, config):
+        with scheduler.slot():
+            return runnable.invoke(prompt, config)
+
+    async def _ainvoke(prompt, config):
+        async with scheduler.aslot():
+            return await runnable.ainvoke(prompt, config)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=f"scheduled_{schema.__name__}")
+
+# --- 3. RESPONSE CACHE ---
+# "Regenerate preview" with identical content + config is served from disk.
+# Pass `config=FRESH` to invoke/ainvoke/batch when the user actually wants a new sample;
+# the fresh result then replaces the cached one.
+FRESH = {"configurable": {"fresh": True}}
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> LLMResponseCache:
+    """Opened on first use, so importing this module does not create the cache file."""
+    return LLMResponseCache()
+
+def _is_fresh(config) -> bool:
+    return bool((config or {}).get("configurable", {}).get("fresh"))
+
+def _with_response_cache(runnable, llm: ChatOllama, schema: Type[BaseModel]):
+    def _lookup(prompt, config):
+        cache_key = LLMResponseCache.make_key(llm.model, llm.temperature, prompt, schema)
+        cached = None if _is_fresh(config) else get_response_cache().get(cache_key, schema)
+        return cache_key, cached
+
+    def _invoke(prompt, config):
+        cache_key, cached = _lookup(prompt, config)
+        if cached is not None:
+            return cached
+        result = runnable.invoke(prompt, config)
+        if result is not None:
+            get_response_cache().put(cache_key, result)
+        return result
+
+    async def _ainvoke(prompt, config):
+        cache_key, cached = _lookup(prompt, config)
+        if cached is not None:
+            return cached
+        result = await runnable.ainvoke(prompt, config)
+        if result is not None:
+            get_response_cache().put(cache_key, result)
+        return result
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=f"cached_{schema.__name__}")
+
+# --- 4. MODEL PINNING ---
+def preload_model(model: str, keep_alive: str = KEEP_ALIVE):
+    """Loads a model into Ollama memory ahead of the first request (empty prompt = load only)."""
+    for host in OLLAMA_HOSTS if upstream_pool is not None else [OLLAMA_BASE_URL]:
+        print(f"📌 Pinning '{model}' in Ollama ({host}) for {keep_alive}...")
+        response = httpx.post(f"{host}/api/generate", json={"model": model, "prompt": "", "keep_alive": keep_alive},
+                              timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
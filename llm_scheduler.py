@@ -0,0 +1,263 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Hashable, List, Optional, Tuple
+from ollama_pool import OLLAMA_HOSTS
+
+# --- 1. CONFIGURATION ---
+# Every LLM call in the process takes a slot here (llm_client wraps get_json_llm), so previews
+# and background jobs (question bank refills, fact extraction) share one budget instead of
+# all hitting Ollama at once. Interactive work always goes first; background fills the gaps.
+INTERACTIVE, BACKGROUND = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", str(4 * max(1, len(OLLAMA_HOSTS)))))  # OLLAMA_NUM_PARALLEL x hosts
+MAX_QUEUE = {INTERACTIVE: 64, BACKGROUND: 512}    # Waiting calls per class before new ones are shed
+MAX_WAIT_S = {INTERACTIVE: 60.0, BACKGROUND: 900.0}  # Admission refuses work that would wait longer
+DEFAULT_CALL_S = 20.0     # Service time estimate before anything is measured
+WINDOW = 500              # Recent waits / service times kept for metrics and estimates
+
+# Who is asking, carried implicitly to the call site (copied into asyncio tasks and LangChain
+# batch threads; plain threads start clean, i.e. background)
+_current_user: ContextVar[Hashable] = ContextVar("llm_user", default="system")
+_current_priority: ContextVar[int] = ContextVar("llm_priority", default=BACKGROUND)
+
+@contextmanager
+def request_context(user: Hashable, priority: int = INTERACTIVE):
+    """Wrap an API handler: every LLM call made inside is queued as `user` at `priority`."""
+    user_token = _current_user.set(user)
+    priority_token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_user.reset(user_token)
+        _current_priority.reset(priority_token)
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile: the smallest value with at least q of the samples at or below it."""
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+class Overloaded(RuntimeError):
+    """Raised instead of queueing: the caller should answer 503 with Retry-After."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# --- 2. THE SCHEDULER ---
+class _Waiter:
+    __slots__ = ("user", "priority", "enqueued_at", "wake", "granted")
+
+    def __init__(self, user: Hashable, priority: int, wake):
+        self.user = user
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.wake = wake
+        self.granted = False
+
+class LLMScheduler:
+    """
+    A freed slot goes to the highest priority class with waiters, and within it to the user
+    with the fewest calls in flight (then the fewest started), so one instructor's 50-card deck
+    can't hold everyone else's preview behind it. Works for threads and event loops alike.
+    The process-wide instance is `scheduler`; request_budget() gives one request its own
+    budget with the same fairness between its topics.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_queue: Dict[int, int] = None,
+                 max_wait: Dict[int, float] = None):
+        self.capacity = max_in_flight
+        self.free = max_in_flight
+        self.max_queue = max_queue or dict(MAX_QUEUE)
+        self.max_wait = max_wait or dict(MAX_WAIT_S)
+        self.queues: Dict[int, OrderedDict] = {p: OrderedDict() for p in PRIORITY_NAMES}  # user -> deque
+        self.in_flight = defaultdict(int)  # Active users only: a user is forgotten when idle (_forget_if_idle)
+        self.started = defaultdict(int)
+        self.waits = {p: deque(maxlen=WINDOW) for p in PRIORITY_NAMES}
+        self.service = deque(maxlen=WINDOW)
+        self.counters = Counter()  # admitted / shed / timed_out per class
+        self._lock = threading.Lock()
+
+    # Admission
+    def _queued(self, priority: int) -> int:
+        return sum(len(waiters) for waiters in self.queues[priority].values())
+
+    def _estimated_wait(self, priority: int) -> float:
+        """Calls that would be served first, drained by `capacity` slots at the average call time."""
+        ahead = sum(self._queued(p) for p in PRIORITY_NAMES if p <= priority)
+        if self.free > ahead:
+            return 0.0
+        avg_call = sum(self.service) / len(self.service) if self.service else DEFAULT_CALL_S
+        return (ahead + 1) * avg_call / self.capacity
+
+    def admit(self, priority: Optional[int] = None):
+        """Request-level check (before any work starts): raises Overloaded rather than accept a request
+        that would blow its wait budget, so a preview is either served whole or refused cleanly."""
+        priority = _current_priority.get() if priority is None else priority
+        with self._lock:
+            wait = self._estimated_wait(priority)
+            full = self._queued(priority) >= self.max_queue[priority]
+            if full or (self.max_wait[priority] is not None and wait > self.max_wait[priority]):
+                self.counters[f"shed_{PRIORITY_NAMES[priority]}"] += 1
+                raise Overloaded(f"LLM queue saturated ({PRIORITY_NAMES[priority]}, ~{wait:.0f}s wait)",
+                                 retry_after=max(1, math.ceil(wait)))
+
+    def retry_after(self, priority: int) -> int:
+        with self._lock:
+            return max(1, math.ceil(self._estimated_wait(priority)))
+
+    def _enqueue(self, user: Hashable, priority: int, wake) -> Optional[_Waiter]:
+        """None = slot granted immediately."""
+        with self._lock:
+            if self.free > 0 and not any(self._queued(p) for p in PRIORITY_NAMES):
+                self.free -= 1
+                self._start(user, priority, 0.0)
+                return None
+            if self._queued(priority) >= self.max_queue[priority]:
+                self.counters[f"shed_{PRIORITY_NAMES[priority]}"] += 1
+                raise Overloaded(f"LLM queue full ({PRIORITY_NAMES[priority]})",
+                                 retry_after=max(1, math.ceil(self._estimated_wait(priority))))
+            waiter = _Waiter(user, priority, wake)
+            self.queues[priority].setdefault(user, deque()).append(waiter)
+            return waiter
+
+    def _start(self, user: Hashable, priority: int, waited: float):
+        self.in_flight[user] += 1
+        self.started[user] += 1
+        self.waits[priority].append(waited)
+        self.counters[f"admitted_{PRIORITY_NAMES[priority]}"] += 1
+
+    def _forget_if_idle(self, user: Hashable):
+        """Drops a user with nothing in flight or queued, so the dicts only hold active users.
+        Their started count restarts at 0 next time: a user coming back from idle goes first."""
+        if self.in_flight.get(user, 0) == 0 and not any(user in self.queues[p] for p in PRIORITY_NAMES):
+            self.in_flight.pop(user, None)
+            self.started.pop(user, None)
+
+    def _release(self, user: Optional[Hashable]):
+        """Hands the slot straight to the next waiter (or frees it). Called with the lock held."""
+        if user is not None:
+            self.in_flight[user] -= 1
+            self._forget_if_idle(user)
+        for priority in sorted(PRIORITY_NAMES):
+            users = self.queues[priority]
+            if not users:
+                continue
+            user = min(users, key=lambda u: (self.in_flight.get(u, 0), self.started.get(u, 0)))
+            waiter = users[user].popleft()
+            if not users[user]:
+                del users[user]
+            waiter.granted = True
+            self._start(waiter.user, priority, time.perf_counter() - waiter.enqueued_at)
+            waiter.wake()
+            return
+        self.free += 1
+
+    def _abandon(self, waiter: _Waiter, keep_if_granted: bool) -> bool:
+        """Leaves the queue; returns True if the slot had already been handed over."""
+        with self._lock:
+            if waiter.granted:
+                if not keep_if_granted:
+                    self._release(waiter.user)  # Slot arrived as we gave up: pass it on
+                return True
+            self.queues[waiter.priority][waiter.user].remove(waiter)
+            if not self.queues[waiter.priority][waiter.user]:
+                del self.queues[waiter.priority][waiter.user]
+            self._forget_if_idle(waiter.user)
+            if keep_if_granted:  # Timed out (a cancelled caller is not counted)
+                self.counters[f"timed_out_{PRIORITY_NAMES[waiter.priority]}"] += 1
+            return False
+
+    def _done(self, user: Hashable, started: float):
+        with self._lock:
+            self.service.append(time.perf_counter() - started)
+            self._release(user)
+
+    # Slots
+    @contextmanager
+    def slot(self, user: Hashable = None, priority: Optional[int] = None):
+        user = _current_user.get() if user is None else user
+        priority = _current_priority.get() if priority is None else priority
+        event = threading.Event()
+        waiter = self._enqueue(user, priority, event.set)
+        if waiter is not None and not event.wait(self.max_wait[priority]):  # None = wait as long as it takes
+            if not self._abandon(waiter, keep_if_granted=True):
+                raise Overloaded(f"Waited over {self.max_wait[priority]:g}s for an LLM slot",
+                                 retry_after=self.retry_after(priority))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._done(user, started)
+
+    @asynccontextmanager
+    async def aslot(self, user: Hashable = None, priority: Optional[int] = None):
+        user = _current_user.get() if user is None else user
+        priority = _current_priority.get() if priority is None else priority
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(user, priority, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, self.max_wait[priority])
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter, keep_if_granted=True):
+                    raise Overloaded(f"Waited over {self.max_wait[priority]:g}s for an LLM slot",
+                                     retry_after=self.retry_after(priority))
+            except asyncio.CancelledError:
+                self._abandon(waiter, keep_if_granted=False)
+                raise
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._done(user, started)
+
+    # Metrics
+    def metrics(self) -> dict:
+        with self._lock:
+            result = {
+                "capacity": self.capacity,
+                "in_flight": self.capacity - self.free,
+                "avg_call_s": round(sum(self.service) / len(self.service), 2) if self.service else None,
+                **self.counters,
+            }
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self.waits[priority])
+                result[f"queue_depth_{name}"] = self._queued(priority)
+                result[f"wait_p50_s_{name}"] = round(percentile(waits, 0.50), 3) if waits else None
+                result[f"wait_p95_s_{name}"] = round(percentile(waits, 0.95), 3) if waits else None
+        return result
+
+scheduler = LLMScheduler()
+
+def request_budget(max_in_flight: int) -> LLMScheduler:
+    """
+    A private budget for one multi-topic request: `async with budget.aslot(topic_id, INTERACTIVE)`.
+    A freed slot goes to the topic with the fewest calls in flight, so one big topic can't starve
+    the others. It never sheds or times out; admission and the global limit stay with `scheduler`.
+    """
+    return LLMScheduler(max_in_flight, max_queue={p: math.inf for p in PRIORITY_NAMES},
+                        max_wait={p: None for p in PRIORITY_NAMES})
+
+# --- 3. HTTP MAPPING ---
+def service_unavailable(error: Overloaded, path: str) -> Tuple[int, dict, dict]:
+    """(status, headers, body) for the documented 503, body in the ErrorResponse format."""
+    body = {
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "status": 503,
+        "error": "Service Unavailable",
+        "message": str(error),
+        "path": path,
+    }
+    return 503, {"Retry-After": str(error.retry_after)}, body
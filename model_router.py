@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel
+from llm_client import get_llm
+from output_repair import repair_stats
+from prompt_budget import PromptBudgetExceeded, budgeted_structured_llm, check_budget, max_num_ctx, plan_call
+from salvage import agenerate_with_salvage, generate_with_salvage
+from telemetry_log import TelemetryLog
+
+# --- 1. CONFIGURATION ---
+# Which model serves which call. Scripts ask for a (task, difficulty) route instead of hard-coding
+# a model; most traffic is easy/medium and runs on the small tier, the large tier is the fallback.
+TIERS = ["small", "large"]  # Cheapest first: the fallback ladder
+TIER_MODELS = {
+    "small": os.getenv("ROUTER_SMALL_MODEL", "llama3"),
+    "large": os.getenv("ROUTER_LARGE_MODEL", "qwen2.5:14b"),
+}
+
+# (task, difficulty) -> tier; "*" matches any difficulty
+ROUTES = {
+    ("header_detection", "*"): "small",
+    ("split", "*"): "small",      # poc_04 chunk summaries
+    ("notes", "*"): "large",      # Study notes (poc_035, poc_21, poc_03): long structured answers
+    ("flashcards", "*"): "small",
+    ("concepts", "*"): "large",   # Fact extraction (poc_15, fact_bank)
+    ("quiz/normal_multiple", "easy"): "small",
+    ("quiz/normal_multiple", "medium"): "small",
+    ("quiz/statement_verification", "easy"): "small",
+    ("quiz/statement_verification", "medium"): "small",
+    ("quiz/statement_counting", "easy"): "small",
+}
+DEFAULT_TIER = "large"  # Anything not listed (e.g. hard questions, statement_counting) goes to the big model
+
+STATS_FILE = "data/route_stats.jsonl"
+MIN_SAMPLES = 10          # Calls on a route before its measured success rate is trusted
+PROMOTE_BELOW = 0.6       # Success rate under which a route starts one tier higher
+FALLBACK_RETRIES = 1      # Salvage retries on a lower tier before moving up
+
+# Routed calls run with one fixed window per model: Ollama reloads a model whenever num_ctx changes,
+# so every batch of every request has to agree on it (capped by the model's own maximum).
+GENERATION_NUM_CTX = int(os.getenv("GENERATION_NUM_CTX", "8192"))
+ITEM_OUTPUT_TOKENS = 300  # Expected answer tokens per generated item (a quiz question with explanation)
+
+# --- 2. ROUTE STATS ---
+route_log = TelemetryLog(STATS_FILE)
+_stats_lock = threading.Lock()
+_totals = defaultdict(lambda: [0, 0, 0.0])  # (task, difficulty, model) -> [calls, ok, seconds], folded in as logged
+
+def record_route(task: str, difficulty: str, model: str, seconds: float, ok: bool):
+    """One line per routed call; ok = the tier delivered everything without escalating."""
+    route_log.append({
+        "timestamp": time.time(),
+        "task": task,
+        "difficulty": difficulty,
+        "model": model,
+        "seconds": round(seconds, 3),
+        "ok": ok,
+    })
+
+def route_stats() -> Dict[Tuple[str, str, str], dict]:
+    """(task, difficulty, model) -> {calls, success_rate, avg_seconds}"""
+    with _stats_lock:
+        entries, reset = route_log.read_new()
+        if reset:
+            _totals.clear()
+        for e in entries:
+            total = _totals[(e["task"], e["difficulty"], e["model"])]
+            total[0] += 1
+            total[1] += e["ok"]
+            total[2] += e["seconds"]
+        return {
+            key: {"calls": calls, "success_rate": ok / calls, "avg_seconds": seconds / calls}
+            for key, (calls, ok, seconds) in _totals.items()
+        }
+
+# --- 3. ROUTING ---
+def configured_tier(task: str, difficulty: str = "*") -> str:
+    return ROUTES.get((task, difficulty)) or ROUTES.get((task, "*")) or DEFAULT_TIER
+
+def route(task: str, difficulty: str = "*", stats: Optional[dict] = None) -> List[str]:
+    """
+    Models to try, cheapest adequate first. A tier whose measured success rate on this route
+    is below PROMOTE_BELOW is skipped, so a bad default routes itself upward.
+    """
+    stats = route_stats() if stats is None else stats
+    ladder = TIERS[TIERS.index(configured_tier(task, difficulty)):]
+    models = [TIER_MODELS[tier] for tier in ladder]
+    while len(models) > 1:
+        measured = stats.get((task, difficulty, models[0]))
+        if measured is None or measured["calls"] < MIN_SAMPLES or measured["success_rate"] >= PROMOTE_BELOW:
+            break
+        models.pop(0)
+    return models
+
+def quiz_model(q_type: str, difficulty: str) -> str:
+    """The model a quiz type starts on (batch_planner only mixes types that share it)."""
+    return route(f"quiz/{q_type}", difficulty)[0]
+
+def quiz_task(q_types: List[str], difficulty: str) -> str:
+    """A mixed batch is routed like its most demanding type: the one whose ladder starts highest."""
+    stats = route_stats()
+    return min((f"quiz/{q_type}" for q_type in q_types), key=lambda task: len(route(task, difficulty, stats)))
+
+def generation_num_ctx(model: str) -> int:
+    return min(GENERATION_NUM_CTX, max_num_ctx(model))
+
+# --- 4. ROUTED CALLS ---
+# Same arguments as (a)generate_with_salvage, minus the llm. Items kept by a lower tier stay;
+# the next tier is asked only for the shortfall, with them listed as already generated.
+# on_attempt gets the model as first argument: (model, requested, kept, seconds).
+# Every prompt is counted against the model's window (item_tokens of answer per requested item)
+# and logged to prompt_budget's usage file; a model whose window can't hold the prompt is skipped.
+def _ladder_kwargs(task, build_prompt, accept, on_attempt, collected, model, item_tokens):
+    num_ctx = generation_num_ctx(model)
+    return {
+        "build_prompt": lambda count, existing: build_prompt(count, collected + existing),
+        "accept": None if accept is None else (lambda item, kept: accept(item, collected + kept)),
+        "on_attempt": None if on_attempt is None else (lambda *args: on_attempt(model, *args)),
+        "on_prompt": lambda prompt, count: check_budget(model, prompt, count * item_tokens, task, num_ctx),
+    }
+
+def _fits(model: str, build_prompt, missing: int, collected: List[BaseModel], item_tokens: int, last: bool,
+          label: str) -> bool:
+    """Whether the model's window holds the next prompt; the last model raises PromptBudgetExceeded instead."""
+    budget = plan_call(model, build_prompt(missing, collected), missing * item_tokens)
+    if budget.total_tokens <= generation_num_ctx(model):
+        return True
+    message = (f"{label}: {budget.total_tokens} tokens needed, {model} runs with "
+               f"num_ctx={generation_num_ctx(model)}")
+    if last:
+        raise PromptBudgetExceeded(message + ". Shorten topicContent (or raise GENERATION_NUM_CTX).")
+    print(f"     ⬆️ {message}, skipping to the next tier")
+    return False
+
+def generate_routed(task: str, difficulty: str, batch_schema: Type[BaseModel], list_key: str,
+                    build_prompt: Callable[[int, List[BaseModel]], str], target: int, temperature: float,
+                    label: str = "batch", max_retries: int = 2, fresh: bool = False,
+                    accept=None, on_attempt=None, dedup=None,
+                    item_tokens: int = ITEM_OUTPUT_TOKENS) -> List[BaseModel]:
+    models = route(task, difficulty)
+    collected: List[BaseModel] = []
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        if not _fits(model, build_prompt, target - len(collected), collected, item_tokens, last, label):
+            continue
+        start = time.perf_counter()
+        collected += generate_with_salvage(
+            get_llm(model, temperature, num_ctx=generation_num_ctx(model)), batch_schema, list_key,
+            target=target - len(collected), label=f"{label} @{model}",
+            max_retries=max_retries if last else FALLBACK_RETRIES, fresh=fresh, dedup=dedup,
+            **_ladder_kwargs(task, build_prompt, accept, on_attempt, collected, model, item_tokens),
+        )
+        ok = len(collected) >= target
+        record_route(task, difficulty, model, time.perf_counter() - start, ok)
+        if ok:
+            break
+        if not last:
+            repair_stats.record("retry")  # The next tier generates the shortfall
+            print(f"     ⬆️ {label}: {target - len(collected)} missing, falling back to {models[i + 1]}")
+    return collected
+
+async def agenerate_routed(task: str, difficulty: str, batch_schema: Type[BaseModel], list_key: str,
+                           build_prompt: Callable[[int, List[BaseModel]], str], target: int, temperature: float,
+                           label: str = "batch", max_retries: int = 2, fresh: bool = False,
+                           accept=None, on_attempt=None, dedup=None,
+                           item_tokens: int = ITEM_OUTPUT_TOKENS) -> List[BaseModel]:
+    models = route(task, difficulty)
+    collected: List[BaseModel] = []
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        if not _fits(model, build_prompt, target - len(collected), collected, item_tokens, last, label):
+            continue
+        start = time.perf_counter()
+        collected += await agenerate_with_salvage(
+            get_llm(model, temperature, num_ctx=generation_num_ctx(model)), batch_schema, list_key,
+            target=target - len(collected), label=f"{label} @{model}",
+            max_retries=max_retries if last else FALLBACK_RETRIES, fresh=fresh, dedup=dedup,
+            **_ladder_kwargs(task, build_prompt, accept, on_attempt, collected, model, item_tokens),
+        )
+        ok = len(collected) >= target
+        record_route(task, difficulty, model, time.perf_counter() - start, ok)
+        if ok:
+            break
+        if not last:
+            repair_stats.record("retry")  # The next tier generates the shortfall
+            print(f"     ⬆️ {label}: {target - len(collected)} missing, falling back to {models[i + 1]}")
+    return collected
+
+def invoke_routed(task: str, schema: Type[BaseModel], prompt: str, temperature: float = 0.0,
+                  difficulty: str = "*", expected_output_tokens: int = 2048) -> BaseModel:
+    """
+    Whole-object structured call (header detection, splitting...): escalates when validation fails
+    or the prompt does not fit the model's window.
+    """
+    models = route(task, difficulty)
+    for i, model in enumerate(models):
+        start = time.perf_counter()
+        try:
+            result = budgeted_structured_llm(model, schema, temperature, expected_output_tokens, task=task,
+                                             num_ctx=generation_num_ctx(model)).invoke(prompt)
+        except Exception as e:
+            if not isinstance(e, PromptBudgetExceeded):  # Too long for the window is not the model's failure
+                record_route(task, difficulty, model, time.perf_counter() - start, False)
+            if i == len(models) - 1:
+                raise
+            repair_stats.record("retry")
+            print(f"     ⬆️ {task}: {model} failed ({e}), falling back to {models[i + 1]}")
+            continue
+        record_route(task, difficulty, model, time.perf_counter() - start, True)
+        return result
+
+# --- MAIN ---
+if __name__ == "__main__":
+    print("🧭 Routes:")
+    for task, difficulty in sorted({*ROUTES, ("quiz/statement_counting", "hard"), ("quiz/normal_multiple", "hard")}):
+        print(f"   {task:<30} {difficulty:<7} -> {' -> '.join(route(task, difficulty))}")
+
+    print("\n📊 Measured:")
+    for (task, difficulty, model), s in sorted(route_stats().items()):
+        print(f"   {task:<30} {difficulty:<7} {model:<14} {s['calls']:>4} calls, "
+              f"{s['success_rate']:.0%} ok, {s['avg_seconds']:.1f}s avg")
@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncContextManager, Callable, Dict, List, Optional, Set
+import httpx
+from langchain_core.runnables import Runnable, RunnableLambda
+
+# --- 1. CONFIGURATION ---
+# OLLAMA_HOSTS="http://gpu-1:11434,http://gpu-2:11434" spreads generation over several inference boxes.
+# Unset (or a single host) keeps the plain one-client setup in llm_client.py.
+OLLAMA_HOSTS = [host.strip().rstrip("/") for host in os.getenv("OLLAMA_HOSTS", "").split(",") if host.strip()]
+HEALTH_INTERVAL = 15.0       # Seconds between background checks of /api/tags and /api/ps
+HEALTH_TIMEOUT = 3.0
+HEDGE = os.getenv("OLLAMA_HEDGE", "1") == "1"  # Duplicate slow async calls onto a second host
+HEDGE_PERCENTILE = 0.95      # A call still running past this latency percentile gets a hedge
+HEDGE_MIN_SAMPLES = 20       # Latencies per model before hedging starts (no guessing on a cold pool)
+HEDGE_MIN_DELAY = 2.0        # Never hedge sooner than this
+LATENCY_WINDOW = 200         # Recent latencies kept per model
+COLD_PENALTY = 2             # A host that must load the model first counts as this many extra requests
+AFFINITY_PREFIX_CHARS = 1024  # Leading prompt chars hashed to pick a prefix's home host: past the rules, into the source
+AFFINITY_SLACK = 2           # The home host keeps a prefix while it has at most this many more requests than the best host
+
+# The ollama client re-raises httpx.ConnectError as the builtin ConnectionError
+CONNECT_ERRORS = (httpx.ConnectError, ConnectionError)
+
+def _model_name(name: str) -> str:
+    # Ollama reports "llama3:latest" for "llama3"
+    return name if ":" in name else f"{name}:latest"
+
+def prefix_key(prompt) -> str:
+    """Hash of the prompt's shared prefix (prompt_layout.py puts rules + source first)."""
+    text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+    return hashlib.sha1(text[:AFFINITY_PREFIX_CHARS].encode("utf-8")).hexdigest()
+
+@asynccontextmanager
+async def _no_slot():
+    yield
+
+# --- 2. UPSTREAM STATE ---
+@dataclass
+class Upstream:
+    url: str
+    healthy: bool = True
+    models: Optional[Set[str]] = None    # Pulled models (None = not checked yet)
+    loaded: Set[str] = field(default_factory=set)  # Models currently in memory (no load delay)
+    outstanding: int = 0
+    last_check: float = 0.0
+
+    def serves(self, model: str) -> bool:
+        return self.healthy and (self.models is None or _model_name(model) in self.models)
+
+# --- 3. THE POOL ---
+class UpstreamPool:
+    """
+    Picks a host per call: healthy + has the model, then fewest requests in flight, where a host
+    that would have to load the model first counts COLD_PENALTY extra. Calls sharing a prompt
+    prefix go to the same home host (rendezvous hash) while it is within AFFINITY_SLACK of the
+    least busy one, so its KV cache is reused (affinity, not pinning).
+    A background thread refreshes health and model presence; a host that refuses a connection
+    is marked down at once and the call moves to the next host.
+    hedge_slot: callable returning an async context manager held by every hedge duplicate
+    (llm_client passes the LLM scheduler's aslot, so hedges count against the global budget).
+    """
+
+    def __init__(self, urls: List[str], health_interval: float = HEALTH_INTERVAL, hedge: bool = HEDGE,
+                 hedge_slot: Callable[[], AsyncContextManager] = _no_slot):
+        self.upstreams = [Upstream(url) for url in urls]
+        self.health_interval = health_interval
+        self.hedge = hedge and len(urls) > 1
+        self.hedge_slot = hedge_slot
+        self.latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.stats = defaultdict(int)  # calls / failovers / hedged / hedge_wins
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checked = threading.Event()  # Set once the first round of checks is done
+        self._thread: Optional[threading.Thread] = None
+
+    # Health checks
+    def check(self, upstream: Upstream):
+        try:
+            with httpx.Client(base_url=upstream.url, timeout=HEALTH_TIMEOUT) as client:
+                tags = client.get("/api/tags").raise_for_status().json()
+                running = client.get("/api/ps").raise_for_status().json()
+            models = {_model_name(m["name"]) for m in tags.get("models", [])}
+            loaded = {_model_name(m["name"]) for m in running.get("models", [])}
+            with self._lock:
+                upstream.healthy, upstream.models, upstream.loaded = True, models, loaded
+        except (httpx.HTTPError, ValueError):
+            with self._lock:
+                upstream.healthy = False
+        upstream.last_check = time.time()
+
+    def check_all(self):
+        for upstream in self.upstreams:
+            self.check(upstream)
+
+    def start(self):
+        """Checks run on the health thread: once right away, then every health_interval."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._thread.start()
+
+    def ready(self):
+        """Blocks until the first round of checks is done, so the first pick is informed."""
+        self.start()
+        self._checked.wait()
+
+    async def aready(self):
+        """Same as ready() without blocking the event loop."""
+        self.start()
+        if not self._checked.is_set():
+            await asyncio.to_thread(self._checked.wait)
+
+    def _health_loop(self):
+        self.check_all()
+        self._checked.set()
+        while not self._stop.wait(self.health_interval):
+            self.check_all()
+
+    def stop(self):
+        self._stop.set()
+
+    # Selection
+    def _candidates(self, model: str, exclude: Set[str]) -> List[Upstream]:
+        return [u for u in self.upstreams if u.url not in exclude and u.serves(model)]
+
+    def has_host(self, model: str, exclude: Set[str] = frozenset()) -> bool:
+        with self._lock:
+            return bool(self._candidates(model, exclude))
+
+    def pick(self, model: str, exclude: Set[str] = frozenset(), prefix: Optional[str] = None) -> Upstream:
+        """prefix: prefix_key() of the prompt; None = plain least-loaded choice."""
+        name = _model_name(model)
+        with self._lock:
+            candidates = self._candidates(model, exclude)
+            if not candidates:
+                raise RuntimeError(f"No healthy Ollama host serves '{model}'")
+            # Rendezvous hash: a prefix keeps its home host as long as that host is a candidate
+            home = None if prefix is None else max(
+                candidates, key=lambda u: hashlib.sha1(f"{u.url}|{prefix}".encode("utf-8")).digest())
+            upstream = min(candidates, key=lambda u: (u.outstanding + COLD_PENALTY * (name not in u.loaded)
+                                                      - AFFINITY_SLACK * (u is home),
+                                                      name not in u.loaded, u is not home))
+            upstream.outstanding += 1
+            return upstream
+
+    @contextmanager
+    def _tracked(self, upstream: Upstream, model: str):
+        """Releases the slot picked in pick(); records latency / marks a refusing host down."""
+        start = time.perf_counter()
+        try:
+            yield
+        except CONNECT_ERRORS:
+            with self._lock:
+                upstream.healthy = False
+            raise
+        else:
+            self.latencies[model].append(time.perf_counter() - start)
+            with self._lock:
+                upstream.loaded.add(_model_name(model))
+        finally:
+            with self._lock:
+                upstream.outstanding -= 1
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        samples = sorted(self.latencies[model])
+        if not self.hedge or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, samples[max(0, math.ceil(HEDGE_PERCENTILE * len(samples)) - 1)])
+
+    # Calls
+    def _invoke(self, model: str, make: Callable[[str], Runnable], prompt, config):
+        self.ready()
+        prefix = prefix_key(prompt)
+        tried = set()
+        while True:
+            upstream = self.pick(model, tried, prefix)
+            self.stats["calls"] += 1
+            try:
+                with self._tracked(upstream, model):
+                    return make(upstream.url).invoke(prompt, config)
+            except CONNECT_ERRORS:
+                tried.add(upstream.url)
+                self.stats["failovers"] += 1  # pick() raises once every host has been tried
+
+    async def _acall(self, upstream: Upstream, model: str, make: Callable[[str], Runnable], prompt, config):
+        self.stats["calls"] += 1
+        with self._tracked(upstream, model):
+            return await make(upstream.url).ainvoke(prompt, config)
+
+    async def _ainvoke_once(self, model: str, make: Callable[[str], Runnable], prompt, config,
+                            used: Set[str], prefix: str):
+        """`used` collects every host this call went to (a hedge must go elsewhere)."""
+        while True:
+            upstream = self.pick(model, used, prefix)
+            used.add(upstream.url)
+            try:
+                return await self._acall(upstream, model, make, prompt, config)
+            except CONNECT_ERRORS:
+                self.stats["failovers"] += 1
+
+    async def _ahedge(self, model: str, make: Callable[[str], Runnable], prompt, config, used: Set[str]):
+        """The duplicate holds its own hedge_slot while it runs, like any other call."""
+        async with self.hedge_slot():
+            backup_host = self.pick(model, exclude=set(used))  # Raises if the other hosts went down meanwhile
+            self.stats["hedged"] += 1
+            return await self._acall(backup_host, model, make, prompt, config)
+
+    async def _ainvoke(self, model: str, make: Callable[[str], Runnable], prompt, config):
+        await self.aready()
+        used: Set[str] = set()
+        tasks = [asyncio.ensure_future(self._ainvoke_once(model, make, prompt, config, used, prefix_key(prompt)))]
+        try:
+            delay = self.hedge_delay(model)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.has_host(model, exclude=used):
+                # Tail call: race a duplicate on another host, first answer wins, the loser is cancelled
+                # (cancelling closes its HTTP request, which makes Ollama stop generating).
+                # No second host for this model: just wait
+                tasks.append(asyncio.ensure_future(self._ahedge(model, make, prompt, config, used)))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.stats["hedge_wins"] += task is not tasks[0]
+                        return task.result()
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                task.cancel()  # No-op for finished tasks
+
+    async def astream(self, model: str, make: Callable[[str], Runnable], prompt, config=None):
+        """
+        Streamed call on the host picked for the prompt. Fails over only until the first chunk arrived,
+        and is never hedged (a duplicate stream would emit everything twice).
+        """
+        await self.aready()
+        prefix = prefix_key(prompt)
+        tried = set()
+        while True:
+            upstream = self.pick(model, tried, prefix)
+            self.stats["calls"] += 1
+            started = False
+            try:
+                with self._tracked(upstream, model):
+                    async for chunk in make(upstream.url).astream(prompt, config):
+                        started = True
+                        yield chunk
+                return
+            except CONNECT_ERRORS:
+                if started:
+                    raise
+                tried.add(upstream.url)
+                self.stats["failovers"] += 1
+
+    def runnable(self, model: str, make: Callable[[str], Runnable]) -> Runnable:
+        """make(url) -> the runnable bound to that host (e.g. get_llm(..., base_url=url).bind(format=...))."""
+        return RunnableLambda(
+            lambda prompt, config: self._invoke(model, make, prompt, config),
+            afunc=lambda prompt, config: self._ainvoke(model, make, prompt, config),
+            name=f"pool_{model}",
+        )
+
+    def status(self) -> List[dict]:
+        with self._lock:
+            return [
+                {"url": u.url, "healthy": u.healthy, "outstanding": u.outstanding,
+                 "models": sorted(u.models or []), "loaded": sorted(u.loaded)}
+                for u in self.upstreams
+            ]
+
+# --- MAIN ---
+if __name__ == "__main__":
+    pool = UpstreamPool(OLLAMA_HOSTS or [os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")])
+    pool.check_all()
+    for host in pool.status():
+        print(f"{'🟢' if host['healthy'] else '🔴'} {host['url']}: {len(host['models'])} models, "
+              f"loaded: {', '.join(host['loaded']) or '-'}")
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+from batch_planner import plan_quiz
+from embedding_dedup import DedupGuard, question_key
+from fact_bank import with_facts
+from llm_scheduler import INTERACTIVE, request_budget, request_context, scheduler as llm_scheduler
+from model_router import quiz_model
+from poc_14_gen_flashcards import TopicPayload as DeckTopicPayload, agenerate_flashcard_deck
+from poc_16_gen_quiz_v2_loop_type import (
+    MAX_CONCURRENCY, TopicPayload as QuizTopicPayload, agenerate_batch, assemble_quiz,
+)
+from topic_dedup import topic_index
+
+# --- 1. PER-TOPIC RESULTS ---
+def topic_result(topic_id: int, result, requested: int, produced: int, errors: List[str], start_time: float) -> dict:
+    if produced == 0:
+        status = "failed"
+    elif produced < requested or errors:
+        status = "partial"
+    else:
+        status = "ok"
+    return {
+        "topic_id": topic_id,
+        "status": status,
+        "requested": requested,
+        "produced": produced,
+        "errors": errors,
+        "seconds": round(time.time() - start_time, 2),
+        "result": result if produced else None,
+    }
+
+# --- 2. CROSS-COURSE REUSE (see topic_dedup.py) ---
+# A topic whose text is a near-copy of one we already generated for (same chapter uploaded by another
+# instructor, re-saved course...) gets that artifact instead of new LLM calls. "Regenerate" (fresh) and
+# topics that already have saved items in the course always generate. A course never reuses its own
+# artifacts: near-copies inside one course are separate topics that each get their own items.
+def reusable_quiz(topic_id: int, payload: QuizTopicPayload, course_id: Optional[int] = None) -> Optional[list]:
+    topic_index.index_topic(topic_id, payload.topicName, payload.topicContent, course_id)
+    config = [c.model_dump() for c in payload.quiz_config]
+    match = topic_index.find_reusable_artifacts(payload.topicContent, "quiz", exclude_course_id=course_id,
+                                                accept=lambda a: a["quiz_config"] == config)
+    if match is None:
+        return None
+    print(f"   ♻️ Topic {topic_id}: reusing the quiz of '{match['title']}' (similarity {match['similarity']:.2f})")
+    return [{**quiz, "topic_title": payload.topicName} for quiz in match["quiz"][0]["result"]]
+
+def reusable_deck(topic_id: int, payload: DeckTopicPayload, course_id: Optional[int] = None) -> Optional[dict]:
+    topic_index.index_topic(topic_id, payload.topicName, payload.topicContent, course_id)
+    amount = payload.config.amount
+    match = topic_index.find_reusable_artifacts(payload.topicContent, "deck", exclude_course_id=course_id,
+                                                accept=lambda a: a["amount"] >= amount)
+    if match is None:
+        return None
+    print(f"   ♻️ Topic {topic_id}: reusing the deck of '{match['title']}' (similarity {match['similarity']:.2f})")
+    deck = match["deck"][0]["result"]
+    return {**deck, "topic_title": payload.topicName, "cards": deck["cards"][:amount]}
+
+# --- 3. REQUEST-LEVEL FAN-OUT ---
+async def agenerate_quiz_request(topics: List[Tuple[int, QuizTopicPayload]], max_concurrency: int = MAX_CONCURRENCY,
+                                 fresh: bool = False, saved: Dict[int, list] = None,
+                                 user_id: Hashable = "anonymous", course_id: Optional[int] = None) -> List[dict]:
+    """
+    POST /quizzes/preview with several quiz_topics: every batch of every topic shares one budget.
+    saved: topic_id -> questions already in the course (near-duplicates of them are regenerated).
+    course_id: the course the topics belong to (its own artifacts are never reused).
+    Raises llm_scheduler.Overloaded (-> 503 + Retry-After) when the service can't take the request.
+    """
+    llm_scheduler.admit(INTERACTIVE)
+    with request_context(user_id, INTERACTIVE):
+        return await _agenerate_quiz_request(topics, max_concurrency, fresh, saved or {}, course_id)
+
+async def _agenerate_quiz_request(topics, max_concurrency, fresh, saved, course_id) -> List[dict]:
+    budget = request_budget(max_concurrency)  # Fair between topics, under the global scheduler
+    start_time = time.time()
+    # Each topic is planned for its share of the slots (proportional to its question count)
+    counts = [sum(t.number for c in payload.quiz_config for t in c.quiz_type_config) for _, payload in topics]
+    total = max(1, sum(counts))
+
+    submitted, reused = [], {}
+    for (topic_id, payload), count in zip(topics, counts):
+        quiz = None if fresh or saved.get(topic_id) else reusable_quiz(topic_id, payload, course_id)
+        if quiz is not None:
+            reused[topic_id] = topic_result(topic_id, quiz, count, count, [], start_time)
+            continue
+        share = max(1, round(max_concurrency * count / total))
+        plan = plan_quiz(payload.quiz_config, quiz_model, share)
+        dedup = DedupGuard(question_key, [question_key(q) for q in saved.get(topic_id, [])])
+        submitted.append((topic_id, with_facts(payload), plan.batches, dedup))
+
+    async def run_batch(topic_id, payload, spec, dedup):
+        async with budget.aslot(topic_id, INTERACTIVE):
+            return await agenerate_batch(payload, spec, fresh=fresh, dedup=dedup)
+
+    async def collect(topic_id, payload, specs, dedup):
+        outcomes = await asyncio.gather(*[run_batch(topic_id, payload, spec, dedup) for spec in specs],
+                                        return_exceptions=True)
+        errors = [f"{spec.label}: {o}" for spec, o in zip(specs, outcomes) if isinstance(o, Exception)]
+        batches = [[] if isinstance(o, Exception) else o for o in outcomes]
+        requested = sum(spec.total for spec in specs)
+        produced = sum(len(b) for b in batches)
+        print(f"   📦 Topic {topic_id}: {produced}/{requested} questions ({time.time() - start_time:.1f}s)")
+        result = topic_result(topic_id, assemble_quiz(payload, specs, batches), requested, produced, errors, start_time)
+        if result["status"] == "ok":
+            topic_index.register_artifact(topic_id, "quiz", {
+                "quiz_config": [c.model_dump() for c in payload.quiz_config], "result": result["result"],
+            })
+        return result
+
+    generated = {s[0]: r for s, r in zip(submitted, await asyncio.gather(*[collect(*s) for s in submitted]))}
+    return [reused.get(topic_id) or generated[topic_id] for topic_id, _ in topics]
+
+async def agenerate_deck_request(topics: List[Tuple[int, DeckTopicPayload]], max_concurrency: int = MAX_CONCURRENCY,
+                                 fresh: bool = False, saved: Dict[int, list] = None,
+                                 user_id: Hashable = "anonymous", course_id: Optional[int] = None) -> List[dict]:
+    """
+    POST /decks/preview with several deck_topics: every shard / top-up call of every deck shares one budget.
+    saved: topic_id -> cards already in the course.
+    course_id: the course the topics belong to (its own artifacts are never reused).
+    Raises llm_scheduler.Overloaded (-> 503 + Retry-After) when the service can't take the request.
+    """
+    llm_scheduler.admit(INTERACTIVE)
+    with request_context(user_id, INTERACTIVE):
+        return await _agenerate_deck_request(topics, max_concurrency, fresh, saved or {}, course_id)
+
+async def _agenerate_deck_request(topics, max_concurrency, fresh, saved, course_id) -> List[dict]:
+    budget = request_budget(max_concurrency)  # Fair between topics, under the global scheduler
+    start_time = time.time()
+
+    async def collect(topic_id, payload):
+        deck = None if fresh or saved.get(topic_id) else reusable_deck(topic_id, payload, course_id)
+        if deck is not None:
+            return topic_result(topic_id, deck, payload.config.amount, len(deck["cards"]), [], start_time)
+        try:
+            deck = await agenerate_flashcard_deck(payload, fresh=fresh,
+                                                  limiter=lambda: budget.aslot(topic_id, INTERACTIVE),
+                                                  saved_cards=saved.get(topic_id, []))
+            errors = []
+        except Exception as e:
+            deck, errors = None, [str(e)]
+        produced = len(deck["cards"]) if deck else 0
+        print(f"   📦 Topic {topic_id}: {produced}/{payload.config.amount} cards ({time.time() - start_time:.1f}s)")
+        result = topic_result(topic_id, deck, payload.config.amount, produced, errors, start_time)
+        if result["status"] == "ok":
+            topic_index.register_artifact(topic_id, "deck", {"amount": payload.config.amount, "result": deck})
+        return result
+
+    return await asyncio.gather(*[collect(topic_id, payload) for topic_id, payload in topics])
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open("data/ai_list_split.json", "r", encoding="utf-8") as f:
+        sections = json.load(f)[:4]
+
+    deck_topics = [
+        (i + 1, DeckTopicPayload(topicName=s["title"], topicContent=s["content"], config={"amount": 5}))
+        for i, s in enumerate(sections)
+    ]
+    start_time = time.time()
+    decks = asyncio.run(agenerate_deck_request(deck_topics, course_id=1))
+    print(f"\n⏱️  {len(decks)} decks in {time.time() - start_time:.2f}s")
+    for d in decks:
+        print(f"   {d['topic_id']}: {d['status']} ({d['produced']}/{d['requested']}) {d['errors'] or ''}")
+
+    quiz_topics = [
+        (i + 1, QuizTopicPayload(topicName=s["title"], topicContent=s["content"], quiz_config=[{
+            "difficulty": "medium",
+            "quiz_type_config": [{"type": "normal_multiple", "number": 2}, {"type": "statement_verification", "number": 2}],
+        }]))
+        for i, s in enumerate(sections)
+    ]
+    start_time = time.time()
+    quizzes = asyncio.run(agenerate_quiz_request(quiz_topics, course_id=1))
+    print(f"\n⏱️  {len(quizzes)} quizzes in {time.time() - start_time:.2f}s")
+    for q in quizzes:
+        print(f"   {q['topic_id']}: {q['status']} ({q['produced']}/{q['requested']}) {q['errors'] or ''}")
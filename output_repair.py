@@ -0,0 +1,215 @@
+import json
+import re
+import threading
+from collections import Counter
+from typing import Any, List, Literal, Optional, Tuple, Type, Union, get_args, get_origin
+from pydantic import BaseModel
+
+# --- 1. TOLERANT PARSE ---
+# Most "invalid" model outputs are one character away from valid: a trailing comma,
+# a markdown fence, or a generation cut off by num_predict in the middle of the last object.
+# Fixing those locally costs microseconds; a retry costs a full generation.
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+def _strip_trailing_commas(text: str) -> str:
+    """Removes `,` before `}` / `]` outside of strings."""
+    out, in_string, escaped = [], False, False
+    for i, ch in enumerate(text):
+        if in_string:
+            in_string = not (ch == '"' and not escaped)
+            escaped = ch == "\\" and not escaped
+        elif ch == '"':
+            in_string = True
+        elif ch == "," and _TRAILING_COMMA.match(text, i):
+            continue
+        out.append(ch)
+    return "".join(out)
+
+def _close_truncated(text: str) -> Optional[str]:
+    """
+    Cuts a truncated document back to the last complete element of its OUTERMOST list (the item array)
+    and closes the open brackets: '{"questions": [{...}, {"id": 3, "options": [{...' -> '{"questions": [{...}]}'.
+    The half-written item is dropped rather than guessed; cutting inside a nested list such as
+    `options` would keep a question with half its options.
+    """
+    stack, in_string, escaped = [], False, False
+    cut = None  # (index to cut at, open brackets at that point)
+    for i, ch in enumerate(text):
+        if in_string:
+            in_string = not (ch == '"' and not escaped)
+            escaped = ch == "\\" and not escaped
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            if ch == "[" and stack.count("[") == 1:
+                cut = (i + 1, list(stack))
+        elif ch in "}]":
+            if not stack:
+                return None
+            stack.pop()
+            if not stack:
+                return text[:i + 1]  # Complete document (trailing junk ignored)
+            # Just closed an element of the item array, or the item array itself
+            if (stack[-1] == "[" and stack.count("[") == 1) or (ch == "]" and "[" not in stack):
+                cut = (i + 1, list(stack))
+        elif ch == "," and stack and stack[-1] == "[" and stack.count("[") == 1:
+            cut = (i, list(stack))
+    if cut is None:
+        return None
+    index, open_brackets = cut
+    return text[:index] + "".join(_CLOSERS[b] for b in reversed(open_brackets))
+
+def tolerant_loads(raw_text: str) -> Tuple[Any, bool]:
+    """Returns (data, repaired); data is None when nothing usable could be recovered."""
+    try:
+        return json.loads(raw_text), False
+    except json.JSONDecodeError:
+        pass
+
+    text = _FENCE.sub("", raw_text)
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None, False
+    text = _strip_trailing_commas(text[start:])
+    for candidate in (text, _close_truncated(text)):
+        if candidate is None:
+            continue
+        try:
+            return json.loads(_strip_trailing_commas(candidate)), True
+        except json.JSONDecodeError:
+            continue
+    return None, False
+
+# --- 2. SCHEMA-GUIDED COERCION ---
+def _normalize_label(value: str) -> str:
+    # "NORMAL_MULTIPLE", "Normal Multiple", "normal-multiple" -> "normal_multiple"
+    return re.sub(r"[\s\-]+", "_", value.strip()).lower()
+
+def coerce(value: Any, annotation: Any) -> Any:
+    """
+    Nudges `value` towards `annotation` (enum case, numbers as strings and the reverse).
+    Anything it doesn't recognise is returned unchanged; pydantic has the final word.
+    """
+    origin = get_origin(annotation)
+    if origin is Union:
+        options = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return coerce(value, options[0]) if value is not None and len(options) == 1 else value
+    if origin is Literal:
+        if isinstance(value, str):
+            by_label = {_normalize_label(str(option)): option for option in get_args(annotation)}
+            return by_label.get(_normalize_label(value), value)
+        return value
+    if origin in (list, List):
+        (item_type,) = get_args(annotation) or (Any,)
+        return [coerce(item, item_type) for item in value] if isinstance(value, list) else value
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        if not isinstance(value, dict):
+            return value
+        return {
+            key: coerce(item, annotation.model_fields[key].annotation) if key in annotation.model_fields else item
+            for key, item in value.items()
+        }
+    if annotation is int and isinstance(value, str) and re.fullmatch(r"\s*-?\d+\s*", value):
+        return int(value)
+    if annotation is int and isinstance(value, float) and value.is_integer():
+        return int(value)
+    if annotation is float and isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    if annotation is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if annotation is bool and isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return value
+
+# --- 3. CONSISTENCY CHECKS ---
+# Schema-valid is not the same as usable: an answer key must point at one of the options.
+def check_answers(value: Any):
+    """Raises ValueError for any question (at any depth) whose correct_option_id names no option."""
+    if isinstance(value, list):
+        for item in value:
+            check_answers(item)
+        return
+    if not isinstance(value, BaseModel):
+        return
+    options, answer = getattr(value, "options", None), getattr(value, "correct_option_id", None)
+    if isinstance(options, list) and answer is not None:
+        ids = [getattr(option, "id", None) for option in options]
+        if answer not in ids:
+            raise ValueError(f"correct_option_id {answer!r} is not among the options {ids}")
+    for name in type(value).model_fields:
+        check_answers(getattr(value, name))
+
+def validate_item(raw: Any, model: Type[BaseModel]) -> Tuple[Optional[BaseModel], bool]:
+    """Returns (instance or None, coerced)."""
+    for coerced, candidate in ((False, raw), (True, None)):
+        try:
+            item = model.model_validate(coerce(raw, model) if coerced else candidate)
+            check_answers(item)
+            return item, coerced
+        except ValueError:  # Includes pydantic's ValidationError
+            continue
+    return None, False
+
+# --- 4. REPAIR STATS ---
+class RepairStats:
+    """
+    Per model response: "clean" (valid as generated), "repaired" (valid only after this layer),
+    "failed" (unusable). "retry" counts the extra generations, recorded by the loops that issue them
+    (salvage, router fallbacks, deck top-ups): only they know whether one actually happens.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def rates(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        responses = sum(counts.get(k, 0) for k in ("clean", "repaired", "failed"))
+        return {
+            **counts,
+            "responses": responses,
+            "repair_rate": counts.get("repaired", 0) / responses if responses else 0.0,
+            "retry_rate": counts.get("retry", 0) / responses if responses else 0.0,
+        }
+
+    def summary(self) -> str:
+        r = self.rates()
+        return (f"🔧 JSON repair: {r['responses']} responses, {r['repair_rate']:.0%} repaired locally, "
+                f"{r['retry_rate']:.0%} needed another generation")
+
+repair_stats = RepairStats()
+
+# --- 5. STRUCTURED PARSE ---
+def parse_structured(raw_text: str, schema: Type[BaseModel]) -> BaseModel:
+    """Whole-object parse for get_structured_llm: strict first, then repair + coerce, else raise."""
+    try:
+        result = schema.model_validate_json(raw_text)
+        check_answers(result)
+        repair_stats.record("clean")
+        return result
+    except ValueError as e:  # Includes pydantic's ValidationError
+        error = e
+
+    data, _ = tolerant_loads(raw_text)
+    if data is not None:
+        try:
+            result = schema.model_validate(coerce(data, schema))
+            check_answers(result)
+            repair_stats.record("repaired")
+            return result
+        except ValueError as e:
+            error = e
+    repair_stats.record("failed")
+    raise ValueError(f"{schema.__name__} output could not be repaired: {error}")
@@ -1,7 +1,7 @@
 import time
 from typing import List
 from pydantic import BaseModel, Field
-from langchain_ollama import ChatOllama
+from llm_client import get_llm, get_structured_llm
 
 # --- 1. DEFINE THE BLUEPRINT ---
 class TopicPlan(BaseModel):
@@ -14,7 +14,7 @@ class ModulePlan(BaseModel):
     topics: List[TopicPlan] = Field(..., description="List of 5-10 logical topics extracted from the text")
 
 # --- 2. SETUP LOCAL LLM ---
-llm = llm = ChatOllama(model="qwen2.5:14b", temperature=0)
+llm = get_llm("qwen2.5:14b", temperature=0)
 
 def create_module_from_markdown():
     # A. READ THE PREPARED MARKDOWN FILE
@@ -38,7 +38,7 @@ def create_module_from_markdown():
     start_time = time.time()
     
     # Bind the Pydantic model to the LLM
-    structured_llm = llm.with_structured_output(ModulePlan)
+    structured_llm = get_structured_llm(llm, ModulePlan)
 
     # Run the chain
     # Slice [:30000] to ensure we don't overflow the local model's context context
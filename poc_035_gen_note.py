@@ -1,17 +1,14 @@
 import time
 import json
-from langchain_ollama import ChatOllama
+from model_router import route
+from prompt_budget import budgeted_structured_llm, count_tokens, max_prompt_tokens
 from pydantic import BaseModel, Field
 from typing import List
 
 # --- 1. CONFIGURATION ---
-# We try to give it a fighting chance by increasing the context window to 32k tokens.
-# Standard Llama 3 is 8k. Qwen 2.5 supports up to 128k, but 32k is a safe local limit.
-llm = ChatOllama(
-    model="qwen2.5:14b", 
-    temperature=0,
-    num_ctx=32768  # Attempt to fit ~25,000 words
-)
+# num_ctx is sized from the real token count (up to the 32k limit for Qwen 2.5 in prompt_budget).
+MODEL = route("notes")[0]
+OUTPUT_TOKENS = 6000  # A full study guide is a long answer
 
 # --- 2. DATA MODELS (Target Output) ---
 class ConceptNote(BaseModel):
@@ -38,22 +35,23 @@ def generate_notes_naive(markdown_file, output_file):
 
     # METRICS
     char_count = len(full_text)
-    est_tokens = char_count / 4  # Rough estimate
+    token_count = count_tokens(full_text, MODEL)
     
     print(f"📊 Statistics:")
     print(f"   - Characters: {char_count}")
-    print(f"   - Est. Tokens: {int(est_tokens)}")
+    print(f"   - Tokens: {token_count}")
     
     # WARNING SYSTEM
-    limit = 30000 # Safety limit for context
+    limit = max_prompt_tokens(MODEL, OUTPUT_TOKENS) - 500  # Room for the instructions
     input_text = full_text
     
-    if est_tokens > limit:
+    if token_count > limit:
         print(f"⚠️  WARNING: Text is too long for one prompt!")
         print(f"   - Truncating to first {limit} tokens to prevent crash.")
-        # Rough cut to fit context
-        input_text = full_text[:(limit * 4)] 
+        # Proportional cut to fit context
+        input_text = full_text[:int(char_count * limit / token_count)]
         print(f"   - ✂️  LOST CONTENT: {char_count - len(input_text)} characters ignored.")
+        print("   - 💡 Run poc_21_map_reduce_notes.py to cover the whole text instead.")
     else:
         print("   - ✅ Text fits within context window (mostly).")
 
@@ -81,7 +79,8 @@ def generate_notes_naive(markdown_file, output_file):
 
     try:
         # We ask for the Full Study Guide in one go
-        response = llm.with_structured_output(FullStudyGuide).invoke(prompt)
+        response = budgeted_structured_llm(MODEL, FullStudyGuide, expected_output_tokens=OUTPUT_TOKENS,
+                                           task="naive_study_guide").invoke(prompt)
         
         duration = time.time() - start_time
         topic_count = len(response.all_topics)
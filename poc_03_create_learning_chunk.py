@@ -1,8 +1,11 @@
 import re
 import json
-from typing import List, Dict
+from typing import Hashable, List, Dict, Optional
 from pydantic import BaseModel, Field
-from langchain_ollama import ChatOllama
+from llm_scheduler import INTERACTIVE, request_context, scheduler
+from model_router import route
+from prompt_budget import budgeted_structured_llm, job_num_ctx, max_prompt_tokens
+from poc_21_map_reduce_notes import split_into_chunks
 
 # --- 1. DATA MODELS (tuned for "Exam Notes") ---
 
@@ -43,9 +46,52 @@ def parse_markdown_sections(markdown_text: str) -> List[Dict[str, str]]:
 
 # --- 3. MAIN SCRIPT ---
 
-llm = ChatOllama(model="llama3", temperature=0.1, num_ctx=8192)
+# One num_ctx for the whole chapter, sized from the largest prompt (see prompt_budget)
+WRITER_MODEL = route("notes")[0]
+NOTES_OUTPUT_TOKENS = 1500
+SECTION_TOKENS = max_prompt_tokens(WRITER_MODEL, NOTES_OUTPUT_TOKENS) - 500  # Room for the instructions
 
-def generate_exam_notes():
+MAX_CONCURRENCY = 4  # Sections in flight at once (match OLLAMA_NUM_PARALLEL)
+PARTIAL_FILE = "data/exam_prep_notes.partial.jsonl"
+OUTPUT_FILE = "data/exam_prep_notes.json"
+
+def build_notes_prompt(topic: Dict[str, str]) -> str:
+    # Prompt explicitly asks for "Student Note Style"
+    return f"""
+            You are a Computer Science student preparing for a final exam.
+            Your goal is to summarize the text below into **High-Quality Study Notes**.
+            
+            TOPIC: {topic['title']}
+            SOURCE TEXT:
+            {topic['content']}
+            
+            INSTRUCTIONS:
+            1. Extract the core concepts.
+            2. **Style:** Use Bullet points (•), **Bold** for terminology, and keep it concise.
+            3. **Focus:** identifying Definitions, Pros/Cons, and Processes.
+            4. If there is a comparison (e.g., A vs B), make it clear.
+            
+            OUTPUT FORMAT:
+            Create a list of 'ConceptNote' objects.
+        """
+
+def split_long_sections(topics: List[Dict[str, str]]) -> List[Dict]:
+    """Sections longer than one call are cut into parts (on paragraphs); their notes are merged back."""
+    parts = []
+    for index, topic in enumerate(topics):
+        chunks = split_into_chunks(topic['content'], SECTION_TOKENS, model=WRITER_MODEL,
+                                   output_tokens=NOTES_OUTPUT_TOKENS)
+        for k, chunk in enumerate(chunks):
+            title = topic['title'] if len(chunks) == 1 else f"{topic['title']} (part {k + 1}/{len(chunks)})"
+            parts.append({"section": index, "title": title, "content": chunk})
+    return parts
+
+def generate_exam_notes(user_id: Optional[Hashable] = None):
+    """user_id set (POST /courses/preview) -> admitted and queued as interactive work; None -> background."""
+    if user_id is not None:
+        scheduler.admit(INTERACTIVE)
+        with request_context(user_id, INTERACTIVE):
+            return generate_exam_notes()
     source_file = "data/md/extracted_text.md"
     try:
         with open(source_file, "r", encoding="utf-8") as f:
@@ -64,47 +110,45 @@ def generate_exam_notes():
     print(f"   Found {len(valid_topics)} study topics.")
 
     # 2. SUMMARIZATION (AI acts as the Buddy)
-    print("\n📝 Phase 2: Writing Exam Notes...")
-    
+    # All sections are submitted as one batch; each result is appended to the JSONL
+    # as soon as it lands, so a crash mid-chapter keeps everything finished so far.
+    print(f"\n📝 Phase 2: Writing Exam Notes ({MAX_CONCURRENCY} sections at a time)...")
+
+    parts = split_long_sections(valid_topics)
+    prompts = [build_notes_prompt(part) for part in parts]
+    writer_llm = budgeted_structured_llm(WRITER_MODEL, TopicNotes, temperature=0.1,
+                                         expected_output_tokens=NOTES_OUTPUT_TOKENS, task="exam_notes",
+                                         num_ctx=job_num_ctx(WRITER_MODEL, prompts, NOTES_OUTPUT_TOKENS))
+
+    completed = {}
+    with open(PARTIAL_FILE, "w", encoding="utf-8") as partial:
+        for index, note_data in writer_llm.batch_as_completed(
+            prompts, config={"max_concurrency": MAX_CONCURRENCY}, return_exceptions=True
+        ):
+            title = parts[index]['title']
+            if isinstance(note_data, Exception):
+                print(f"   ❌ {title}: {note_data}")
+                continue
+
+            notes = [note.model_dump() for note in note_data.chunks]
+            completed[index] = notes
+            partial.write(json.dumps({"index": index, "section_title": title, "notes": notes}, ensure_ascii=False) + "\n")
+            partial.flush()
+            print(f"   > [{len(completed)}/{len(parts)}] Notes on: {title} Done.")
+
+    # 3. SAVE (Ordered merge, parts of a long section joined back together)
     final_notes = []
-
-    writer_llm = llm.with_structured_output(TopicNotes)
-
-    for index, topic in enumerate(valid_topics): 
-        print(f"   > Taking notes on: {topic['title']}...", end="", flush=True)
-        
-        # Prompt explicitly asks for "Student Note Style"
-        note_data = writer_llm.invoke(f"""
-            You are a Computer Science student preparing for a final exam.
-            Your goal is to summarize the text below into **High-Quality Study Notes**.
-            
-            TOPIC: {topic['title']}
-            SOURCE TEXT:
-            {topic['content'][:12000]} 
-            
-            INSTRUCTIONS:
-            1. Extract the core concepts.
-            2. **Style:** Use Bullet points (•), **Bold** for terminology, and keep it concise.
-            3. **Focus:** identifying Definitions, Pros/Cons, and Processes.
-            4. If there is a comparison (e.g., A vs B), make it clear.
-            
-            OUTPUT FORMAT:
-            Create a list of 'ConceptNote' objects.
-        """)
-
-        final_notes.append({
-            "section_title": topic['title'],
-            "notes": [note.model_dump() for note in note_data.chunks]
-        })
-        
-        print(" Done.")
-
-    # 3. SAVE
-    with open("data/exam_prep_notes.json", "w", encoding="utf-8") as f:
+    for section, topic in enumerate(valid_topics):
+        done = [i for i in sorted(completed) if parts[i]['section'] == section]
+        if done:
+            final_notes.append({
+                "section_title": topic['title'],
+                "notes": [note for i in done for note in completed[i]],
+            })
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
         json.dump(final_notes, f, indent=2, ensure_ascii=False)
 
-    print("\n✅ Exam Notes Generated!")
+    print(f"\n✅ Exam Notes Generated! ({len(final_notes)}/{len(valid_topics)} sections)")
 
 if __name__ == "__main__":
     generate_exam_notes()
-    
\ No newline at end of file
@@ -1,27 +1,29 @@
 import json
 import numpy as np
-from langchain_ollama import ChatOllama
-from sentence_transformers import SentenceTransformer
+from llm_client import get_llm, get_structured_llm
+from model_router import route
 from sklearn.metrics.pairwise import cosine_similarity
 from pydantic import BaseModel, Field
 from typing import List
+from embedder import load_embedder, split_sentences
 
 # --- 1. SETUP MODELS ---
-llm = ChatOllama(model="llama3", temperature=0.1)
-embedder = SentenceTransformer('all-MiniLM-L6-v2') 
+llm = get_llm(route("split")[0], temperature=0.1)
+embedder = load_embedder()  # Backend from EMBEDDING_BACKEND (torch / onnx / onnx-int8)
 
 # --- 2. THE SEMANTIC SPLITTER ---
-def split_text_semantically(text: str, threshold: float = 0.45) -> List[str]:
+def split_text_semantically(text: str, threshold: float = 0.45, encoder=None) -> List[str]:
+    # `encoder` can be an EmbeddingPool for large documents; defaults to the in-process embedder
     print("   ...Calculating semantic vectors...")
     
     # Clean and split into sentences
-    sentences = [s.strip() for s in text.replace('\n', ' ').split('.') if len(s) > 10]
+    sentences = split_sentences(text)
     
     if not sentences:
         return []
 
     # Convert sentences to Vectors
-    embeddings = embedder.encode(sentences)
+    embeddings = (encoder or embedder).encode(sentences)
 
     # Calculate similarity
     similarities = []
@@ -81,7 +83,7 @@ def generate_notes_from_messy_text():
     # STEP 2: GENERATE NOTES
     print("\n🧠 Phase 2: Generating Study Notes...")
     final_notes = []
-    writer_llm = llm.with_structured_output(ChunkSummary)
+    writer_llm = get_structured_llm(llm, ChunkSummary)
 
     # Processing first 3 chunks for demo speed
     for i, chunk_text in enumerate(chunks[:3]):
@@ -2,12 +2,12 @@ import pdfplumber
 import json
 import re
 from collections import defaultdict
-from langchain_ollama import ChatOllama
+from model_router import invoke_routed
 from pydantic import BaseModel, Field
 from typing import List
 
 # --- 1. SETUP ---
-llm = ChatOllama(model="llama3", temperature=0)
+# The model is picked per call by model_router (route: header_detection)
 
 # --- 2. DATA MODELS ---
 class HeaderAnalysis(BaseModel):
@@ -126,7 +126,8 @@ def get_ai_header_sizes(font_stats):
     
     context = "\n".join(summary)
     
-    response = llm.with_structured_output(HeaderAnalysis).invoke(f"""
+    # Small-tier task: escalates to the large model only if the answer fails validation
+    response = invoke_routed("header_detection", HeaderAnalysis, f"""
         Analyze this PDF font data to find Section Headers.
         
         DATA:
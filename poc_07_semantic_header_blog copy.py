@@ -2,12 +2,12 @@ import pdfplumber
 import json
 import re
 from collections import defaultdict
-from langchain_ollama import ChatOllama
+from llm_client import get_llm, get_structured_llm
 from pydantic import BaseModel, Field
 from typing import List
 
 # --- 1. SETUP ---
-llm = ChatOllama(model="llama3", temperature=0)
+llm = get_llm("llama3", temperature=0)
 
 # --- 2. DATA MODEL ---
 # We ask for a LIST of sizes, not just H1/H2
@@ -122,7 +122,7 @@ def get_split_sizes_from_ai(font_stats):
     Return a list of floats (e.g. [18.0, 14.0]) that I should use as triggers to split the text.
     """
     
-    response = llm.with_structured_output(SplitStrategy).invoke(prompt)
+    response = get_structured_llm(llm, SplitStrategy).invoke(prompt)
     
     print(f"   -> AI Logic: {response.reasoning}")
     print(f"   -> Split Triggers: {response.target_font_sizes}")
@@ -2,11 +2,11 @@ import pdfplumber
 import json
 import re
 from typing import List, Tuple
-from langchain_ollama import ChatOllama
+from llm_client import get_llm
 
 # --- 1. SETUP ---
 # Using temperature=0 for strict logical reasoning
-llm = ChatOllama(model="llama3", temperature=0)
+llm = get_llm("llama3", temperature=0)
 
 # --- 2. STEP 1: EXTRACT & GROUP METADATA (The Java Logic) ---
 def get_pdf_metadata(pdf_path):
@@ -2,12 +2,12 @@ import pdfplumber
 import json
 import re
 from collections import defaultdict
-from langchain_ollama import ChatOllama
+from llm_client import get_llm, get_structured_llm
 from pydantic import BaseModel, Field
 from typing import List
 
 # --- 1. CONFIGURATION ---
-llm = ChatOllama(model="llama3", temperature=0)
+llm = get_llm("llama3", temperature=0)
 
 # --- 2. DATA MODELS ---
 class SplitStrategy(BaseModel):
@@ -176,7 +176,7 @@ def get_split_sizes_from_ai(font_stats):
     Return a list of floats representing the header sizes found.
     """
     
-    response = llm.with_structured_output(SplitStrategy).invoke(prompt)
+    response = get_structured_llm(llm, SplitStrategy).invoke(prompt)
     
     print(f"   -> AI Logic: {response.reasoning}")
     print(f"   -> Split Triggers: {response.target_font_sizes}")
@@ -1,9 +1,9 @@
 import json
 from typing import List, Literal
-from langchain_ollama import ChatOllama
+from llm_client import get_llm, get_structured_llm
 from pydantic import BaseModel, Field
 
-llm = ChatOllama(model="qwen2.5:14b", temperature=0.3)
+llm = get_llm("qwen2.5:14b", temperature=0.3)
 
 
 class QuestionTypeRequest(BaseModel):
@@ -151,7 +151,7 @@ def generate_quiz_for_topic(payload: TopicPayload):
         """
 
         try:
-            quiz_result = llm.with_structured_output(GeneratedQuiz).invoke(prompt)
+            quiz_result = get_structured_llm(llm, GeneratedQuiz).invoke(prompt)
             
             # Metadata injection
             quiz_result.topic_title = payload.topicName
@@ -1,11 +1,11 @@
 import json
 import time
 from typing import List, Literal
-from langchain_ollama import ChatOllama
+from llm_client import get_llm, get_structured_llm
 from pydantic import BaseModel, Field
 
 # --- 1. CONFIGURATION ---
-llm = ChatOllama(model="qwen2.5:14b", temperature=0.3)
+llm = get_llm("qwen2.5:14b", temperature=0.3)
 
 # --- 2. DATA MODELS ---
 
@@ -177,7 +177,7 @@ def generate_quiz_for_topic(payload: TopicPayload):
         max_retries = 2
         for attempt in range(max_retries + 1):
             try:
-                quiz_result = llm.with_structured_output(GeneratedQuiz).invoke(prompt)
+                quiz_result = get_structured_llm(llm, GeneratedQuiz).invoke(prompt)
                 
                 # Metadata injection
                 quiz_result.topic_title = payload.topicName
@@ -1,10 +1,23 @@
+import asyncio
 import json
+import math
 from typing import List, Literal
-from langchain_ollama import ChatOllama
+from embedding_dedup import DedupGuard, card_key
+from fact_bank import with_facts
+from model_router import agenerate_routed
+from output_repair import repair_stats
+from salvage import existing_items_block
 from pydantic import BaseModel, Field
 
 # --- 1. CONFIGURATION ---
-llm = ChatOllama(model="qwen2.5:14b", temperature=0.3)
+TEMPERATURE = 0.3  # The model itself comes from model_router (route: flashcards)
+
+# Large decks are split into parallel sub-requests over different parts of the text:
+# output tokens are generated sequentially per call, so 5 x 10 cards beats 1 x 50.
+SHARD_SIZE = 10          # Max cards per call
+MAX_CONCURRENCY = 4      # Parallel calls when no shared limiter is passed in
+TOP_UP_ROUNDS = 2        # Extra calls for cards lost to failures / near-duplicate removal
+CARD_TOKENS = 120        # Expected answer tokens per card (prompt budget, see model_router)
 
 # --- 2. DATA MODELS ---
 
@@ -28,12 +41,17 @@ class FlashcardDeck(BaseModel):
     topic_title: str
     cards: List[FlashcardItem]
 
+# C. LLM BATCH MODEL (What the model returns; wrapped into a FlashcardDeck afterwards)
+class FlashcardBatch(BaseModel):
+    cards: List[FlashcardItem]
+
 # --- 3. GENERATION LOGIC ---
-def generate_flashcard_deck(payload: TopicPayload):
-    print(f"🚀 Generating Deck for: {payload.topicName} ({payload.config.amount} cards)")
-    
+def build_deck_prompt(payload: TopicPayload, amount: int, existing: List[FlashcardItem] = None) -> str:
+    # On a top-up retry, list the cards we already kept so the model doesn't repeat them
+    existing_block = existing_items_block(existing or [], "front_text")
+
     # We default to a "Balanced" mix since there is no difficulty selection
-    prompt = f"""
+    return f"""
     You are an Expert Tutor creating a Flashcard Deck for a student.
     
     TOPIC: {payload.topicName}
@@ -41,7 +59,7 @@ def generate_flashcard_deck(payload: TopicPayload):
     {payload.topicContent}
     
     TASK:
-    Create exactly {payload.config.amount} high-quality flashcards to help the student memorize the key concepts from the text.
+    Create exactly {amount} high-quality flashcards to help the student memorize the key concepts from the text.
     
     GUIDELINES:
     1. **Focus:** Cover the most important definitions, advantages, disadvantages, and code concepts.
@@ -56,32 +74,97 @@ def generate_flashcard_deck(payload: TopicPayload):
     
     DIVERSITY RULE:
     - Each card must cover a DIFFERENT fact. Do not repeat the same concept twice.
-    
+    {existing_block}
     OUTPUT FORMAT:
-    Return a valid JSON object matching the 'FlashcardDeck' schema.
+    Return a valid JSON object with a list of 'cards'.
     """
 
-    # Retry Loop (Standard Stability Pattern)
-    max_retries = 2
-    for attempt in range(max_retries + 1):
-        try:
-            deck_result = llm.with_structured_output(FlashcardDeck).invoke(prompt)
-            
-            # Metadata injection
-            deck_result.topic_title = payload.topicName
-            
-            # Validation: Did we get enough cards?
-            if len(deck_result.cards) < payload.config.amount:
-                print(f"   ⚠️ Warning: Requested {payload.config.amount}, got {len(deck_result.cards)}")
-            
-            print(f"   ✅ Success! Generated {len(deck_result.cards)} flashcards.")
-            return deck_result.dict()
-
-        except Exception as e:
-            print(f"   ⚠️ Error on attempt {attempt+1}: {e}")
-            if attempt == max_retries:
-                print("   ❌ Failed to generate deck.")
-                return None
+def split_content(text: str, parts: int) -> List[str]:
+    """Near-equal segments cut on line boundaries (fewer if the text is short)."""
+    lines = text.splitlines(keepends=True)
+    target = len(text) / max(1, parts)
+    segments, current = [], ""
+    for line in lines:
+        current += line
+        if len(current) >= target and len(segments) < parts - 1:
+            segments.append(current)
+            current = ""
+    if current.strip():
+        segments.append(current)
+    return [seg for seg in segments if seg.strip()] or [text]
+
+def split_amount(amount: int, parts: int) -> List[int]:
+    base, extra = divmod(amount, parts)
+    return [base + 1 if i < extra else base for i in range(parts)]
+
+async def agenerate_cards(payload: TopicPayload, content: str, amount: int, existing: List[FlashcardItem],
+                          limiter, label: str, fresh: bool, dedup: DedupGuard) -> List[FlashcardItem]:
+    shard = payload.model_copy(update={"topicContent": content})
+    async with limiter():
+        # Decks run on the small tier (model_router); shortfalls fall back to the large model
+        return await agenerate_routed(
+            "flashcards", "*", FlashcardBatch, "cards",
+            lambda count, kept: build_deck_prompt(shard, count, existing + kept),
+            target=amount, temperature=TEMPERATURE, label=label, fresh=fresh, dedup=dedup,
+            item_tokens=CARD_TOKENS,
+        )
+
+async def agenerate_flashcard_deck(payload: TopicPayload, fresh: bool = False, limiter=None,
+                                   saved_cards: List[FlashcardItem] = ()):
+    """
+    fresh=True -> skip the response cache ("regenerate" should give a new sample).
+    limiter: callable returning an async context manager that holds one LLM slot
+    (the multi-topic orchestrator passes its request_budget() slot; default is a local semaphore).
+    saved_cards: cards already in the course; near-duplicates of them are regenerated.
+    """
+    payload = with_facts(payload)  # Shards split the fact list instead of the raw text when it exists
+    if limiter is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        limiter = lambda: semaphore
+
+    # Shared by all shards: a card that paraphrases an accepted one is rejected and regenerated
+    dedup = DedupGuard(card_key, [card_key(c) for c in saved_cards])
+
+    amount = payload.config.amount
+    segments = split_content(payload.topicContent, math.ceil(amount / SHARD_SIZE))
+    print(f"🚀 Generating Deck for: {payload.topicName} ({amount} cards, {len(segments)} shard(s))")
+
+    # 1. Shards in parallel, each over its own part of the text
+    shard_results = await asyncio.gather(*[
+        agenerate_cards(payload, segment, count, [], limiter, f"flashcards/{payload.topicName}#{i+1}", fresh, dedup)
+        for i, (segment, count) in enumerate(zip(segments, split_amount(amount, len(segments))))
+    ])
+    cards = [card for shard in shard_results for card in shard]
+
+    # 2. Shards that ran out of retries: top up from the whole text, telling the model what the deck already has
+    for round_no in range(TOP_UP_ROUNDS):
+        shortfall = amount - len(cards)
+        if shortfall <= 0 or not cards:  # Nothing worked at all -> don't burn more calls
+            break
+        print(f"   🩹 Top-up {round_no + 1}: {shortfall} card(s) missing")
+        repair_stats.record("retry")
+        extra = await agenerate_cards(payload, payload.topicContent, shortfall, cards, limiter,
+                                      f"flashcards/{payload.topicName}+top-up", fresh=True, dedup=dedup)
+        cards += extra
+
+    cards = cards[:amount]
+    if not cards:
+        print("   ❌ Failed to generate deck.")
+        return None
+    if len(cards) < amount:
+        print(f"   ⚠️ Warning: Requested {amount}, got {len(cards)}")
+
+    # Renumber: cards from different calls each start at 1
+    for i, card in enumerate(cards):
+        card.id = i + 1
+
+    # Metadata injection
+    deck_result = FlashcardDeck(topic_title=payload.topicName, cards=cards)
+    print(f"   ✅ Success! Generated {len(deck_result.cards)} flashcards.")
+    return deck_result.dict()
+
+def generate_flashcard_deck(payload: TopicPayload, fresh: bool = False):
+    return asyncio.run(agenerate_flashcard_deck(payload, fresh=fresh))
 
 # --- 4. TEST RUNNER ---
 if __name__ == "__main__":
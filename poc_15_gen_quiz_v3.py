@@ -1,11 +1,21 @@
 import json
 import random
-from typing import List, Literal
-from langchain_ollama import ChatOllama
+from typing import List, Literal, Optional
+from llm_client import get_llm, get_structured_llm
+from model_router import route
+from prompt_budget import budgeted_structured_llm
+from poc_21_map_reduce_notes import estimate_tokens, split_into_chunks
 from pydantic import BaseModel, Field
 
 # --- 1. CONFIGURATION ---
-llm = ChatOllama(model="qwen2.5:14b", temperature=0.2)
+llm = get_llm("qwen2.5:14b", temperature=0.2)
+EXTRACT_MODEL = route("concepts")[0]
+
+# Extraction reads the whole source, so it gets a real window (Ollama's default 2048 silently truncates).
+# The window is fixed: a num_ctx that changes from call to call makes Ollama reload the model.
+EXTRACT_NUM_CTX = 8192
+EXTRACT_OUTPUT_TOKENS = 2500   # Room for ~40 facts
+EXTRACT_CHUNK_TOKENS = EXTRACT_NUM_CTX - EXTRACT_OUTPUT_TOKENS - 500  # Longer text is extracted chunk by chunk
 
 # --- 2. DATA MODELS ---
 
@@ -107,7 +117,15 @@ def build_single_type_instruction(q_type: str, difficulty: str) -> str:
 # --- 4. PIPELINE FUNCTIONS ---
 
 def step_1_extract_concepts(text: str, count: int) -> List[KeyConcept]:
-    """Extracts atomic facts."""
+    """Extracts atomic facts (text longer than one window is split, the count shared by length)."""
+    chunks = split_into_chunks(text, EXTRACT_CHUNK_TOKENS, model=EXTRACT_MODEL, output_tokens=EXTRACT_OUTPUT_TOKENS)
+    if len(chunks) > 1:
+        sizes = [estimate_tokens(chunk, EXTRACT_MODEL) for chunk in chunks]
+        concepts = []
+        for chunk, size in zip(chunks, sizes):
+            concepts.extend(step_1_extract_concepts(chunk, max(1, round(count * size / sum(sizes)))))
+        return concepts[:count]
+
     print(f"   🔍 Phase 1: Extracting {count} unique concepts...")
     
     prompt = f"""
@@ -125,7 +143,10 @@ def step_1_extract_concepts(text: str, count: int) -> List[KeyConcept]:
     """
     
     try:
-        result = llm.with_structured_output(ConceptList).invoke(prompt)
+        extractor = budgeted_structured_llm(EXTRACT_MODEL, ConceptList, temperature=llm.temperature,
+                                            expected_output_tokens=EXTRACT_OUTPUT_TOKENS, task="concepts",
+                                            num_ctx=EXTRACT_NUM_CTX)
+        result = extractor.invoke(prompt)
         return result.concepts
     except Exception as e:
         print(f"Extraction failed: {e}")
@@ -162,41 +183,82 @@ def step_2_generate_questions(concepts: List[KeyConcept], config_type: str, diff
     """
     
     try:
-        result = llm.with_structured_output(GeneratedQuiz).invoke(prompt)
+        result = get_structured_llm(llm, GeneratedQuiz).invoke(prompt)
         return result.questions
     except Exception as e:
         print(f"Generation failed: {e}")
         return []
 
+def partition_concepts(concepts: List[KeyConcept], quotas: List[int]) -> List[List[KeyConcept]]:
+    """
+    Deals the extracted facts out to the type generators, round-robin so every type
+    gets facts from the whole text. If extraction came back short, each slot shrinks
+    proportionally (largest remainder) instead of the last types getting nothing.
+    """
+    total = sum(quotas)
+    if len(concepts) < total:
+        shares = [q * len(concepts) / total for q in quotas]
+        sizes = [int(share) for share in shares]
+        by_remainder = sorted(range(len(quotas)), key=lambda i: shares[i] - sizes[i], reverse=True)
+        for i in by_remainder[:len(concepts) - sum(sizes)]:
+            sizes[i] += 1
+    else:
+        sizes = list(quotas)
+
+    slots = [[] for _ in quotas]
+    remaining = iter(concepts)
+    while any(len(slot) < size for slot, size in zip(slots, sizes)):
+        for slot, size in zip(slots, sizes):
+            if len(slot) < size:
+                slot.append(next(remaining))
+    return slots
+
 # --- 5. ORCHESTRATOR ---
 
-def generate_robust_quiz(payload):
+def generate_robust_quiz(payload, concepts: Optional[List[KeyConcept]] = None):
+    """`concepts`: precomputed facts for this topic (see fact_bank.py) -> Phase 1 is skipped."""
     print(f"🚀 Starting Pipeline for: {payload['topicName']}")
     
     final_questions = []
     current_id_counter = 1
-    
-    for quiz_cfg in payload['quiz_config']:
-        difficulty = quiz_cfg['difficulty']
+
+    # Every (difficulty, type) request that the facts will be shared between
+    slots = [
+        (quiz_cfg['difficulty'], type_cfg['type'], type_cfg['number'])
+        for quiz_cfg in payload['quiz_config']
+        for type_cfg in quiz_cfg['quiz_type_config']
+    ]
+
+    # STEP 1: Extract ONCE for the whole request (the source text is read a single time)
+    total = sum(n for _, _, n in slots)
+    if total <= 0:
+        print("   ⚠️ Nothing requested (all counts are 0).")
+        return final_questions
+    if concepts:
+        # Fact bank: no extraction call; spread the request over the whole bank
+        concepts = concepts[::max(1, len(concepts) // total)][:total]
+        print(f"   🏦 Phase 1: Using {len(concepts)} facts from the fact bank.")
+    else:
+        concepts = step_1_extract_concepts(payload['topicContent'], count=total)
+    if not concepts:
+        return final_questions
+
+    # Unique IDs: the LLM sometimes restarts numbering
+    for i, concept in enumerate(concepts):
+        concept.concept_id = i + 1
+
+    for (difficulty, q_type, _), slot_concepts in zip(slots, partition_concepts(concepts, [n for _, _, n in slots])):
+        if not slot_concepts:
+            continue
+
+        # STEP 2: Generate (Now with strict formatting)
+        questions = step_2_generate_questions(slot_concepts, q_type, difficulty)
         
-        for type_cfg in quiz_cfg['quiz_type_config']:
-            q_type = type_cfg['type']
-            q_count = type_cfg['number']
-            
-            # STEP 1: Extract
-            concepts = step_1_extract_concepts(payload['topicContent'], count=q_count)
-            
-            if not concepts:
-                continue
-
-            # STEP 2: Generate (Now with strict formatting)
-            questions = step_2_generate_questions(concepts, q_type, difficulty)
-            
-            for q in questions:
-                q.id = current_id_counter
-                q.type = q_type 
-                current_id_counter += 1
-                final_questions.append(q)
+        for q in questions:
+            q.id = current_id_counter
+            q.type = q_type 
+            current_id_counter += 1
+            final_questions.append(q)
 
     return final_questions
 
@@ -1,11 +1,21 @@
+import asyncio
 import json
 import time
-from typing import List, Literal
-from langchain_ollama import ChatOllama
+from collections import defaultdict
+from typing import List, Literal, Tuple
+from batch_planner import BatchSpec, plan_quiz, record_attempt
+from embedding_dedup import DedupGuard, question_key
+from fact_bank import with_facts
+from llm_client import get_llm
+from model_router import agenerate_routed, generate_routed, quiz_model, quiz_task
+from output_repair import repair_stats
+from prompt_layout import assemble_prompt, shared_prefix, source_block
+from salvage import existing_items_block
 from pydantic import BaseModel, Field
 
 # --- 1. CONFIGURATION ---
-llm = ChatOllama(model="qwen2.5:14b", temperature=0.3)
+# Temperature and the batch planner's reference model; each call's model comes from model_router
+llm = get_llm("qwen2.5:14b", temperature=0.3)
 
 # --- 2. DATA MODELS ---
 
@@ -114,9 +124,78 @@ def build_single_type_instruction(q_type: str, difficulty: str, count: int) -> s
     return ""
 
 # --- 4. GENERATION LOOP ---
-def generate_quiz_for_topic(payload: TopicPayload):
+# Identical for every batch -> goes first so Ollama can reuse its KV cache (see prompt_layout.py)
+QUIZ_SYSTEM_TEXT = """
+You are a Professor creating Exam Questions.
+
+GENERAL RULES:
+1. Questions must be self-contained (don't say "as seen above").
+2. Explanations must explain the PRINCIPLE, not just cite the text.
+3. Do not produce duplicates.
+
+OUTPUT:
+Return a JSON object containing a list of questions.
+"""
+
+def build_quiz_prefix(payload: TopicPayload) -> str:
+    return shared_prefix(QUIZ_SYSTEM_TEXT, source_block(payload.topicName, payload.topicContent))
+
+def build_batch_prompt(payload: TopicPayload, difficulty: str, q_type: str, q_count: int,
+                       existing: List[QuizQuestion] = None) -> str:
+    # Build specific instructions for just this batch
+    type_instructions = build_single_type_instruction(q_type, difficulty, q_count)
+    # On a top-up retry, list what we already kept so the model doesn't repeat it
+    existing_block = existing_items_block(existing or [], "question_text")
+
+    # Everything that varies per batch comes AFTER the shared prefix
+    return assemble_prompt(build_quiz_prefix(payload), f"""
+            TASK:
+            Generate exactly {q_count} questions of type '{q_type}'.
+            
+            DIFFICULTY: {difficulty.upper()}
+            
+            STRICT FORMATTING RULES:
+            {type_instructions}
+            {existing_block}
+            """)
+
+def build_mixed_batch_prompt(payload: TopicPayload, difficulty: str, parts: List[Tuple[str, int]],
+                             existing: List[QuizQuestion] = None) -> str:
+    """Several types in one call (see batch_planner.py). Only asks for what each type is still missing."""
+    existing = existing or []
+    missing = [(q_type, count - sum(q.type == q_type for q in existing)) for q_type, count in parts]
+    missing = [(q_type, count) for q_type, count in missing if count > 0]
+    if len(missing) == 1:
+        return build_batch_prompt(payload, difficulty, missing[0][0], missing[0][1], existing)
+
+    type_instructions = "\n".join(build_single_type_instruction(q_type, difficulty, count) for q_type, count in missing)
+    counts = ", ".join(f"{count} of type '{q_type}'" for q_type, count in missing)
+    existing_block = existing_items_block(existing, "question_text")
+
+    return assemble_prompt(build_quiz_prefix(payload), f"""
+            TASK:
+            Generate exactly {sum(count for _, count in missing)} questions: {counts}.
+            Set each question's 'type' to its type ID.
+            
+            DIFFICULTY: {difficulty.upper()}
+            
+            STRICT FORMATTING RULES:
+            {type_instructions}
+            {existing_block}
+            """)
+
+def quota_filter(parts: List[Tuple[str, int]]):
+    """Salvage `accept` hook: keep at most `count` questions of each requested type."""
+    quotas = dict(parts)
+    return lambda q, collected: sum(c.type == q.type for c in collected) < quotas.get(q.type, 0)
+
+def generate_quiz_for_topic(payload: TopicPayload, fresh: bool = False, saved_questions: List[QuizQuestion] = ()):
+    # fresh=True -> skip the response cache ("regenerate" should give a new sample)
+    # saved_questions -> questions already in the course; near-duplicates of them are regenerated
     print(f"🚀 Processing Topic: {payload.topicName}")
+    payload = with_facts(payload)  # Prompt from the precomputed fact list when the course save produced one
     final_results = []
+    dedup = DedupGuard(question_key, [question_key(q) for q in saved_questions])
 
     # LEVEL 1: Loop through Difficulty Configs
     for config in payload.quiz_config:
@@ -131,55 +210,20 @@ def generate_quiz_for_topic(payload: TopicPayload):
             q_count = type_req.number
             
             print(f"  👉 Generating {q_count} questions of type: '{q_type}'...")
-            
-            # Build specific instructions for just this batch
-            type_instructions = build_single_type_instruction(q_type, config.difficulty, q_count)
-
-            prompt = f"""
-            You are a Professor creating Exam Questions.
-            TOPIC: {payload.topicName}
-            SOURCE MATERIAL:
-            {payload.topicContent}
-            
-            TASK:
-            Generate exactly {q_count} questions of type '{q_type}'.
-            
-            DIFFICULTY: {config.difficulty.upper()}
-            
-            STRICT FORMATTING RULES:
-            {type_instructions}
-            
-            GENERAL RULES:
-            1. Questions must be self-contained (don't say "as seen above").
-            2. Explanations must explain the PRINCIPLE, not just cite the text.
-            3. Do not produce duplicates.
-            
-            OUTPUT:
-            Return a JSON object containing a list of questions.
-            """
-
-            # LEVEL 3: Retry Loop for API Reliability
-            max_retries = 2
-            batch_success = False
-            for attempt in range(max_retries + 1):
-                try:
-                    # We use a simpler model (GeneratedQuizBatch) for partial results
-                    batch_result = llm.with_structured_output(GeneratedQuizBatch).invoke(prompt)
-                    
-                    # Post-Processing: Fix IDs and Append
-                    for q in batch_result.questions:
-                        q.id = global_id_counter # Overwrite LLM's ID with our global counter
-                        global_id_counter += 1
-                        aggregated_questions.append(q)
-                        
-                    print(f"     ✅ Batch complete. Added {len(batch_result.questions)} questions.")
-                    batch_success = True
-                    break
-                except Exception as e:
-                    print(f"     ⚠️ Attempt {attempt+1} failed: {e}")
-            
-            if not batch_success:
-                print(f"     ❌ Skipping type {q_type} due to repeated errors.")
+
+            # LEVEL 3: Retry Loop - valid questions are kept, retries only ask for the shortfall
+            # Model per (type, difficulty) from model_router, falling back to the larger one on failure
+            questions = generate_routed(
+                f"quiz/{q_type}", config.difficulty, GeneratedQuizBatch, "questions",
+                lambda count, existing: build_batch_prompt(payload, config.difficulty, q_type, count, existing),
+                target=q_count, temperature=llm.temperature, label=q_type, fresh=fresh, dedup=dedup,
+            )
+
+            # Post-Processing: Fix IDs and Append
+            for q in questions:
+                q.id = global_id_counter # Overwrite LLM's ID with our global counter
+                global_id_counter += 1
+                aggregated_questions.append(q)
 
         # Aggregate into final object for this difficulty
         final_quiz = FinalQuizOutput(
@@ -191,7 +235,66 @@ def generate_quiz_for_topic(payload: TopicPayload):
 
     return final_results
 
-# --- 5. TEST RUNNER ---
+# --- 5. ASYNC ENGINE (All planned batches in flight at once) ---
+MAX_CONCURRENCY = 4  # How many requests our Ollama host serves in parallel (OLLAMA_NUM_PARALLEL)
+
+async def agenerate_batch(payload: TopicPayload, spec: BatchSpec, fresh: bool = False,
+                          dedup: DedupGuard = None) -> List[QuizQuestion]:
+    return await agenerate_routed(
+        quiz_task([q_type for q_type, _ in spec.parts], spec.difficulty), spec.difficulty,
+        GeneratedQuizBatch, "questions",
+        lambda count, existing: build_mixed_batch_prompt(payload, spec.difficulty, spec.parts, existing),
+        target=spec.total, temperature=llm.temperature, label=spec.label, fresh=fresh,
+        accept=quota_filter(spec.parts),
+        on_attempt=lambda model, requested, kept, seconds: record_attempt(model, spec, requested, kept, seconds),
+        dedup=dedup,
+    )
+
+async def agenerate_planned_batch(payload: TopicPayload, spec: BatchSpec, semaphore: asyncio.Semaphore,
+                                  fresh: bool = False, dedup: DedupGuard = None) -> List[QuizQuestion]:
+    async with semaphore:
+        return await agenerate_batch(payload, spec, fresh=fresh, dedup=dedup)
+
+def assemble_quiz(payload: TopicPayload, specs: List[BatchSpec], batches: List[List[QuizQuestion]]) -> List[dict]:
+    """Reassemble per difficulty, types in requested order, then assign IDs."""
+    by_difficulty = defaultdict(list)
+    for spec, questions in zip(specs, batches):
+        by_difficulty[spec.difficulty].extend(questions)
+
+    final_results = []
+    for config in payload.quiz_config:
+        type_order = [type_req.type for type_req in config.quiz_type_config]
+        aggregated_questions = sorted(by_difficulty[config.difficulty], key=lambda q: type_order.index(q.type))
+
+        for global_id, q in enumerate(aggregated_questions, start=1):
+            q.id = global_id
+
+        final_quiz = FinalQuizOutput(
+            topic_title=payload.topicName,
+            difficulty=config.difficulty,
+            questions=aggregated_questions
+        )
+        final_results.append(final_quiz.dict())
+
+    return final_results
+
+async def agenerate_quiz_for_topic(payload: TopicPayload, max_concurrency: int = MAX_CONCURRENCY, fresh: bool = False,
+                                   saved_questions: List[QuizQuestion] = ()):
+    print(f"🚀 Processing Topic: {payload.topicName} (up to {max_concurrency} concurrent batches)")
+    payload = with_facts(payload)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # One guard for all batches: paraphrases across types (and of saved questions) get regenerated
+    dedup = DedupGuard(question_key, [question_key(q) for q in saved_questions])
+
+    # The planner picks call sizes / type mixing from measured throughput and failure rates
+    plan = plan_quiz(payload.quiz_config, quiz_model, max_concurrency)
+    batches = await asyncio.gather(*[
+        agenerate_planned_batch(payload, spec, semaphore, fresh=fresh, dedup=dedup) for spec in plan.batches
+    ])
+    return assemble_quiz(payload, plan.batches, batches)
+
+# --- 6. TEST RUNNER ---
 if __name__ == "__main__":
     # Same mock content as before...
     mock_content = """
@@ -213,7 +316,11 @@ if __name__ == "__main__":
     }
 
     payload = TopicPayload(**request_data)
-    results = generate_quiz_for_topic(payload)
+
+    start_time = time.time()
+    results = asyncio.run(agenerate_quiz_for_topic(payload))
+    print(f"\n⏱️  Generated in {time.time() - start_time:.2f}s")
+    print(repair_stats.summary())
 
     print("\n" + "="*50)
     for quiz in results:
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+from typing import Dict, List
+from embedder import BACKENDS, load_embedder, split_sentences
+
+# --- 1. CONFIGURATION ---
+SOURCE_FILE = "data/md/extracted_text.md"
+
+# Minimum per-sentence cosine vs. the PyTorch reference
+PARITY_THRESHOLDS = {
+    "onnx": 0.999,       # Same fp32 weights, only the runtime differs
+    "onnx-int8": 0.98,   # Quantized weights drift slightly
+}
+
+# --- 2. PARITY CHECK ---
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity between two embedding matrices."""
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(ref * cand, axis=1)
+
+def check_parity(sentences: List[str]) -> bool:
+    print(f"🧪 Parity check on {len(sentences)} sentences...")
+    reference = load_embedder("torch").encode(sentences)
+
+    all_passed = True
+    for backend, threshold in PARITY_THRESHOLDS.items():
+        candidate = load_embedder(backend).encode(sentences)
+        cosines = cosine_agreement(reference, candidate)
+        passed = bool(cosines.min() >= threshold)
+        all_passed = all_passed and passed
+
+        status = "✅" if passed else "❌"
+        print(f"   {status} {backend:<10} min cos: {cosines.min():.5f} | mean cos: {cosines.mean():.5f} (threshold {threshold})")
+
+    return all_passed
+
+# --- 3. THROUGHPUT BENCHMARK ---
+def benchmark_backends(sentences: List[str], batch_size: int = 32) -> Dict[str, float]:
+    print(f"\n⏱️  Benchmarking {len(sentences)} sentences (batch_size={batch_size})...")
+    results = {}
+
+    for backend in BACKENDS:
+        embedder = load_embedder(backend)
+        embedder.encode(sentences[:batch_size])  # Warm-up (graph init, thread pools)
+
+        start_time = time.time()
+        embedder.encode(sentences, batch_size=batch_size)
+        duration = time.time() - start_time
+
+        results[backend] = len(sentences) / duration
+        print(f"   🔹 {backend:<10} {results[backend]:>8.1f} sentences/sec ({duration:.2f}s)")
+
+    return results
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open(SOURCE_FILE, "r", encoding="utf-8") as f:
+        sentences = split_sentences(f.read())
+
+    parity_ok = check_parity(sentences[:256])
+    results = benchmark_backends(sentences)
+
+    baseline = results["torch"]
+    print("\n" + "="*50)
+    for backend, rate in results.items():
+        print(f"📊 {backend:<10} {rate / baseline:.2f}x vs torch")
+    print("="*50)
+    print("✅ Parity OK" if parity_ok else "❌ Parity FAILED")
@@ -0,0 +1,54 @@
+import os
+import time
+from typing import Dict, List
+from embedder import split_sentences
+from embedding_pool import EmbeddingPool
+
+# --- 1. CONFIGURATION ---
+SOURCE_FILE = "data/md/extracted_text.md"
+BOOK_MULTIPLIER = 8  # One chapter x 8 ~= a book-sized input
+
+# --- 2. BATCH INGESTION (Pool reused across documents) ---
+def ingest_documents(documents: Dict[str, str], pool: EmbeddingPool) -> Dict[str, int]:
+    print(f"\n📚 Ingesting {len(documents)} documents through one pool...")
+    vector_counts = {}
+    for name, text in documents.items():
+        start_time = time.time()
+        vectors = pool.encode(split_sentences(text))
+        vector_counts[name] = len(vectors)
+        print(f"   > {name}: {len(vectors)} vectors in {time.time() - start_time:.2f}s")
+    return vector_counts
+
+# --- 3. SCALING BENCHMARK ---
+def benchmark_scaling(sentences: List[str], worker_counts: List[int]) -> Dict[int, float]:
+    print(f"\n⏱️  Encoding {len(sentences)} sentences with different pool sizes...")
+    results = {}
+    for workers in worker_counts:
+        with EmbeddingPool(num_workers=workers) as pool:
+            pool.encode(sentences[:workers * pool.batch_size])  # Warm-up: every worker loads its model
+
+            start_time = time.time()
+            pool.encode(sentences)
+            results[workers] = len(sentences) / (time.time() - start_time)
+
+    baseline = results[worker_counts[0]]
+    for workers, rate in results.items():
+        print(f"   🔹 {workers:>2} workers: {rate:>8.1f} sentences/sec ({rate / baseline:.2f}x)")
+    return results
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open(SOURCE_FILE, "r", encoding="utf-8") as f:
+        chapter = f.read()
+
+    book_sentences = split_sentences(chapter) * BOOK_MULTIPLIER
+
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    benchmark_scaling(book_sentences, worker_counts)
+
+    # Several documents, one pool: models are loaded once per worker, not once per document
+    half = len(chapter) // 2
+    documents = {"chapter_1_part_a": chapter[:half], "chapter_1_part_b": chapter[half:], "chapter_1_full": chapter}
+    with EmbeddingPool() as pool:
+        ingest_documents(documents, pool)
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import numpy as np
+from embedder import load_embedder, split_sentences
+from embedding_store import FORMATS, EmbeddingStore, save_embeddings
+
+# --- 1. CONFIGURATION ---
+SOURCE_FILE = "data/md/extracted_text.md"
+TOP_K = 10
+NUM_QUERIES = 200
+
+# --- 2. MEASUREMENT ---
+def recall_at_k(exact_top: np.ndarray, approx_top: np.ndarray) -> float:
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact_top, approx_top))
+    return hits / exact_top.size
+
+def measure_formats(vectors: np.ndarray, queries: np.ndarray):
+    print(f"📦 Corpus: {len(vectors)} vectors x {vectors.shape[1]} dims | {len(queries)} queries | recall@{TOP_K}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {}
+        for fmt in FORMATS:
+            save_embeddings(os.path.join(tmp, fmt), vectors, fmt=fmt)
+            stores[fmt] = EmbeddingStore(os.path.join(tmp, fmt))
+
+        # Ground truth = float32 exact search
+        exact_top = np.array([stores["float32"].search(q, TOP_K) for q in queries])
+        baseline_bytes = stores["float32"].nbytes()
+
+        print("\n" + "="*60)
+        print(f"{'FORMAT':<10}{'BYTES':>12}{'SIZE':>10}{'RECALL':>12}")
+        print("-"*60)
+        for fmt, store in stores.items():
+            approx_top = np.array([store.search(q, TOP_K) for q in queries])
+            recall = recall_at_k(exact_top, approx_top)
+            size_ratio = store.nbytes() / baseline_bytes
+            print(f"{fmt:<10}{store.nbytes():>12}{size_ratio:>9.2f}x{recall:>12.4f}")
+        print("="*60)
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open(SOURCE_FILE, "r", encoding="utf-8") as f:
+        sentences = split_sentences(f.read())
+
+    print(f"🧠 Embedding {len(sentences)} sentences...")
+    vectors = load_embedder().encode(sentences)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    rng = np.random.default_rng(42)
+    queries = vectors[rng.choice(len(vectors), size=min(NUM_QUERIES, len(vectors)), replace=False)]
+
+    measure_formats(vectors, queries)
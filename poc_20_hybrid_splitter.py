@@ -0,0 +1,109 @@
+import json
+from typing import Dict, List
+from poc_05_chunking_header import extract_clean_topics
+from poc_04_semantic_splitter import split_text_semantically
+from prompt_budget import count_tokens
+
+# --- 1. CONFIGURATION ---
+# Sections are sized so that one section + prompt + answer fits the writer's context window.
+NUM_CTX = 8192           # Same window as the exam-notes writer (poc_03)
+PROMPT_OVERHEAD = 600    # Instructions + schema
+OUTPUT_RESERVE = 1600    # Room for the structured answer
+MIN_SECTION_TOKENS = 150 # Anything smaller gets merged into its neighbour
+
+WRITER_MODEL = "llama3"
+
+def estimate_tokens(text: str) -> int:
+    return count_tokens(text, WRITER_MODEL)
+
+def section_budget(num_ctx: int = NUM_CTX) -> int:
+    return num_ctx - PROMPT_OVERHEAD - OUTPUT_RESERVE
+
+# --- 2. STEP 2: SEMANTIC REFINEMENT (Only for oversized sections) ---
+def pack_chunks(chunks: List[str], max_tokens: int) -> List[str]:
+    """Greedily glues consecutive semantic chunks back together up to the budget."""
+    packed = []
+    current, current_tokens = "", 0  # Running count: each chunk is tokenized once
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if current and current_tokens + 1 + tokens > max_tokens:
+            packed.append(current)
+            current, current_tokens = chunk, tokens
+        else:
+            current = f"{current} {chunk}".strip()
+            current_tokens += tokens + (1 if current_tokens else 0)
+    if current:
+        packed.append(current)
+    return packed
+
+def refine_oversized(sections: List[Dict[str, str]], max_tokens: int, threshold: float, encoder=None) -> List[Dict[str, str]]:
+    refined = []
+    for section in sections:
+        tokens = estimate_tokens(section['content'])
+        if tokens <= max_tokens:
+            refined.append(section)
+            continue
+
+        print(f"   🔬 Refining '{section['title']}' (~{tokens} tokens)...")
+        parts = pack_chunks(split_text_semantically(section['content'], threshold=threshold, encoder=encoder), max_tokens)
+        for i, part in enumerate(parts):
+            part_tokens = estimate_tokens(part)
+            if part_tokens > max_tokens:
+                print(f"      ⚠️ Part {i+1} is still ~{part_tokens} tokens (no semantic break found)")
+            refined.append({"title": f"{section['title']} (Part {i+1})", "content": part})
+    return refined
+
+# --- 3. STEP 3: MERGE TINY NEIGHBOURS ---
+def merge_tiny_sections(sections: List[Dict[str, str]], min_tokens: int, max_tokens: int) -> List[Dict[str, str]]:
+    merged, sizes = [], []  # sizes[i]: running token count of merged[i]
+    for section in sections:
+        tokens = estimate_tokens(section['content'])
+        if merged:
+            prev = merged[-1]
+            is_tiny = tokens < min_tokens or sizes[-1] < min_tokens
+            if is_tiny and sizes[-1] + tokens <= max_tokens:
+                prev['title'] = f"{prev['title']} / {section['title']}"
+                prev['content'] = prev['content'].rstrip() + "\n" + section['content']
+                sizes[-1] += tokens
+                continue
+        merged.append(dict(section))
+        sizes.append(tokens)
+    return merged
+
+# --- 4. PIPELINE ---
+def hybrid_split(pdf_path: str, num_ctx: int = NUM_CTX, min_tokens: int = MIN_SECTION_TOKENS,
+                 threshold: float = 0.45, encoder=None) -> List[Dict[str, str]]:
+    max_tokens = section_budget(num_ctx)
+
+    # STEP 1: Cheap split on font-size headers
+    print(f"\n📑 Phase 1: Header split (budget {max_tokens} tokens / section)...")
+    sections = extract_clean_topics(pdf_path)
+    total_chars = sum(len(s['content']) for s in sections)
+    oversized_chars = sum(len(s['content']) for s in sections if estimate_tokens(s['content']) > max_tokens)
+    print(f"   Found {len(sections)} header sections.")
+
+    # STEP 2: Embeddings only where the header split wasn't enough
+    print("\n🧠 Phase 2: Semantic refinement of oversized sections...")
+    sections = refine_oversized(sections, max_tokens, threshold, encoder)
+
+    # STEP 3: Merge crumbs
+    print("\n🧹 Phase 3: Merging tiny sections...")
+    sections = merge_tiny_sections(sections, min_tokens, max_tokens)
+
+    embedded_pct = 100 * oversized_chars / total_chars if total_chars else 0
+    print(f"\n📊 Embedded {embedded_pct:.1f}% of the text | {len(sections)} final sections")
+    return sections
+
+# --- MAIN ---
+if __name__ == "__main__":
+    source_pdf = "data/pdf/sample_textbook_chapter_1.pdf"
+
+    final_sections = hybrid_split(source_pdf)
+
+    output_file = "data/hybrid_semantic_split.json"
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(final_sections, f, indent=2, ensure_ascii=False)
+
+    print(f"\n✅ Saved {len(final_sections)} sections to {output_file}")
+    for s in final_sections[:10]:
+        print(f"   📌 {s['title']} (~{estimate_tokens(s['content'])} tokens)")
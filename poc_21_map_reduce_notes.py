@@ -0,0 +1,218 @@
+import asyncio
+import json
+import re
+import time
+from typing import Hashable, List, Optional
+from llm_scheduler import INTERACTIVE, request_context, scheduler
+from model_router import route
+from prompt_budget import budgeted_structured_llm, count_tokens, job_num_ctx, max_prompt_tokens
+from poc_02_create_module import ModulePlan
+from poc_035_gen_note import FullStudyGuide, TopicSection
+
+# --- 1. CONFIGURATION ---
+# Instead of one giant prompt (poc_035) or a hard slice (poc_02), the book is cut into
+# chunks that comfortably fit the context window, mapped in parallel, then reduced.
+MODEL = route("notes")[0]
+MAP_OUTPUT_TOKENS = 2500
+REDUCE_OUTPUT_TOKENS = 1500
+CHUNK_TOKENS = 5000      # Fits the 8k bucket with instructions + answer (max is max_prompt_tokens)
+MAX_CONCURRENCY = 4
+REDUCE_FAN_IN = 4        # Partial module plans merged per reduce call
+
+def estimate_tokens(text: str, model: str = MODEL) -> int:
+    return count_tokens(text, model)
+
+# --- 2. SPLIT (Context-sized chunks, cut on paragraph boundaries) ---
+def split_paragraph(paragraph: str, max_tokens: int, model: str = MODEL) -> List[str]:
+    """
+    A paragraph too big for one chunk is cut on sentence boundaries (words, then characters, for a
+    single sentence that is still too big); consecutive sentences are packed back up to max_tokens.
+    """
+    if estimate_tokens(paragraph, model) + 1 <= max_tokens:
+        return [paragraph]
+    sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+    if len(sentences) == 1:
+        words = paragraph.split()
+        if len(words) > 1:
+            sentences = [" ".join(words[:len(words) // 2]), " ".join(words[len(words) // 2:])]
+        else:
+            sentences = [paragraph[:len(paragraph) // 2], paragraph[len(paragraph) // 2:]]
+    pieces = [piece for sentence in sentences for piece in split_paragraph(sentence, max_tokens, model)]
+
+    parts, current = [], ""
+    for piece in pieces:
+        joined = f"{current} {piece}" if current else piece
+        if current and estimate_tokens(joined, model) + 1 > max_tokens:
+            parts.append(current)
+            joined = piece
+        current = joined
+    return parts + [current]
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_TOKENS, model: str = MODEL,
+                      output_tokens: int = MAP_OUTPUT_TOKENS) -> List[str]:
+    """Chunks of at most max_tokens, capped so each fits the model's window next to output_tokens of answer."""
+    max_tokens = min(max_tokens, max_prompt_tokens(model, output_tokens) - 500)
+    paragraphs = [piece for p in re.split(r'\n\s*\n', text) if p.strip()
+                  for piece in split_paragraph(p.strip(), max_tokens, model)]
+    chunks = []
+    current, current_tokens = [], 0  # Running count: each paragraph is tokenized once
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph, model) + 1  # + the blank-line separator
+        # Start a new chunk at a '## ' header if the current one is already half full
+        starts_section = paragraph.startswith("## ") and current_tokens > max_tokens // 2
+        too_big = current_tokens + tokens > max_tokens
+        if current and (starts_section or too_big):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+# --- 3. MAP PROMPTS ---
+def build_notes_prompt(chunk: str, part: int, total: int) -> str:
+    return f"""
+    You are a student preparing for a final exam.
+    This is PART {part} of {total} of a textbook. Extract the study topics in THIS PART only.
+
+    SOURCE TEXT:
+    {chunk}
+
+    INSTRUCTIONS:
+    1. Identify every distinct 'Item', 'Section', or 'Chapter' in this part.
+    2. For EACH topic, create a list of detailed concept notes.
+    3. If the part starts mid-section, continue with that section's name.
+
+    OUTPUT FORMAT:
+    Return a JSON object with a list of 'all_topics'.
+    """
+
+def build_plan_prompt(chunk: str, part: int, total: int) -> str:
+    return f"""
+    Analyze PART {part} of {total} of the following text and create a structured learning module for this part.
+
+    TEXT:
+    {chunk}
+    """
+
+def build_plan_reduce_prompt(plans: List[ModulePlan]) -> str:
+    partials = json.dumps([p.model_dump() for p in plans], indent=2, ensure_ascii=False)
+    return f"""
+    You are merging partial learning-module plans that were generated from consecutive parts of ONE document.
+
+    PARTIAL PLANS (in document order):
+    {partials}
+
+    TASK:
+    1. Write ONE title and ONE overview covering all parts.
+    2. Merge topics that cover the same subject; keep document order.
+    3. Keep between 5 and 10 topics in total.
+
+    Return a single ModulePlan.
+    """
+
+# --- 4. MAP ---
+async def map_chunks(chunks: List[str], schema, build_prompt) -> List:
+    prompts = [build_prompt(chunk, i + 1, len(chunks)) for i, chunk in enumerate(chunks)]
+    # One num_ctx for the whole batch: mixed sizes would make Ollama reload the model between calls
+    mapper = budgeted_structured_llm(MODEL, schema, expected_output_tokens=MAP_OUTPUT_TOKENS, task=f"map_{schema.__name__}",
+                                     num_ctx=job_num_ctx(MODEL, prompts, MAP_OUTPUT_TOKENS))
+    results = await mapper.abatch(prompts, config={"max_concurrency": MAX_CONCURRENCY}, return_exceptions=True)
+
+    partials = []
+    for i, result in enumerate(results):
+        if isinstance(result, Exception) or result is None:
+            print(f"   ❌ Part {i+1} failed: {result}")
+        else:
+            partials.append(result)
+    print(f"   ✅ Mapped {len(partials)}/{len(chunks)} parts.")
+    return partials
+
+# --- 5. REDUCE ---
+def reduce_study_guides(partials: List[FullStudyGuide]) -> FullStudyGuide:
+    """
+    Deterministic merge: consecutive parts that continue the same topic are joined,
+    everything else is kept in order. No extra LLM call and no notes dropped.
+    """
+    merged: List[TopicSection] = []
+    for guide in partials:
+        for topic in guide.all_topics:
+            # Only the topic right before can be continued (a later "Summary" is a different section)
+            if merged and merged[-1].topic_name.strip().lower() == topic.topic_name.strip().lower():
+                merged[-1].notes.extend(topic.notes)
+            else:
+                merged.append(TopicSection(topic_name=topic.topic_name, notes=list(topic.notes)))
+    return FullStudyGuide(all_topics=merged)
+
+def concat_plans(plans: List[ModulePlan]) -> ModulePlan:
+    """Fallback when a merge call fails: every topic of the group is kept, in order."""
+    return ModulePlan(
+        title=plans[0].title,
+        overview=" ".join(p.overview for p in plans),
+        topics=[topic for p in plans for topic in p.topics],
+    )
+
+async def reduce_module_plans(plans: List[ModulePlan]) -> Optional[ModulePlan]:
+    """Hierarchical reduce: merge REDUCE_FAN_IN plans per call, level by level, until one is left (None if none)."""
+    if not plans:
+        return None
+    level = 1
+    while len(plans) > 1:
+        groups = [plans[i:i + REDUCE_FAN_IN] for i in range(0, len(plans), REDUCE_FAN_IN)]
+        print(f"   🔁 Reduce level {level}: {len(plans)} plans -> {len(groups)}")
+        prompts = [build_plan_reduce_prompt(group) for group in groups]
+        reducer = budgeted_structured_llm(MODEL, ModulePlan, expected_output_tokens=REDUCE_OUTPUT_TOKENS, task="reduce_ModulePlan",
+                                          num_ctx=job_num_ctx(MODEL, prompts, REDUCE_OUTPUT_TOKENS))
+        results = await reducer.abatch(prompts, config={"max_concurrency": MAX_CONCURRENCY}, return_exceptions=True)
+        # A failed merge is replaced by the plain concatenation of its group, so no topic is lost
+        plans = [concat_plans(group) if isinstance(r, Exception) or r is None else r for group, r in zip(groups, results)]
+        level += 1
+    return plans[0]
+
+# --- 6. PIPELINES ---
+# Both back POST /courses/preview: user_id set -> admitted and queued as interactive work
+# (raises llm_scheduler.Overloaded -> 503 + Retry-After); None (scripts) -> background.
+async def generate_study_guide(text: str, user_id: Optional[Hashable] = None) -> FullStudyGuide:
+    if user_id is not None:
+        scheduler.admit(INTERACTIVE)
+        with request_context(user_id, INTERACTIVE):
+            return await generate_study_guide(text)
+    chunks = split_into_chunks(text)
+    print(f"\n🗺️  Map: {len(chunks)} chunks -> study notes ({MAX_CONCURRENCY} in parallel)...")
+    partials = await map_chunks(chunks, FullStudyGuide, build_notes_prompt)
+    print("\n🧩 Reduce: merging partial study guides...")
+    return reduce_study_guides(partials)
+
+async def generate_module_plan(text: str, user_id: Optional[Hashable] = None) -> Optional[ModulePlan]:
+    if user_id is not None:
+        scheduler.admit(INTERACTIVE)
+        with request_context(user_id, INTERACTIVE):
+            return await generate_module_plan(text)
+    chunks = split_into_chunks(text)
+    print(f"\n🗺️  Map: {len(chunks)} chunks -> module plans ({MAX_CONCURRENCY} in parallel)...")
+    partials = await map_chunks(chunks, ModulePlan, build_plan_prompt)
+    print("\n🧩 Reduce: merging module plans...")
+    return await reduce_module_plans(partials)
+
+# --- MAIN ---
+if __name__ == "__main__":
+    input_md = "data/md/extracted_text.md"
+    with open(input_md, "r", encoding="utf-8") as f:
+        full_text = f.read()
+
+    print(f"📊 {len(full_text)} characters (~{estimate_tokens(full_text)} tokens), nothing truncated.")
+
+    start_time = time.time()
+    guide = asyncio.run(generate_study_guide(full_text))
+    print(f"\n✅ Study guide: {len(guide.all_topics)} topics in {time.time() - start_time:.2f}s")
+    with open("data/map_reduce_notes.json", "w", encoding="utf-8") as f:
+        json.dump(guide.model_dump(), f, indent=2, ensure_ascii=False)
+
+    start_time = time.time()
+    plan = asyncio.run(generate_module_plan(full_text))
+    if plan is None:
+        raise SystemExit("❌ Every part failed, no module plan.")
+    print(f"\n📦 MODULE: {plan.title} ({len(plan.topics)} topics) in {time.time() - start_time:.2f}s")
+    for i, topic in enumerate(plan.topics):
+        print(f"   🔹 TOPIC {i+1}: {topic.title}")
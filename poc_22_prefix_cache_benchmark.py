@@ -0,0 +1,88 @@
+import json
+import statistics
+from llm_client import get_llm
+from model_router import TIER_MODELS, generation_num_ctx
+from prompt_layout import shared_fraction
+from poc_16_gen_quiz_v2_loop_type import (
+    GeneratedQuizBatch, TopicPayload, build_batch_prompt, build_single_type_instruction, llm,
+)
+
+# --- 1. CONFIGURATION ---
+# Measures prompt-evaluation time of the per-type quiz batches for one topic:
+#   "shared prefix" -> poc_16 layout (rules + source first, batch instructions last)
+#   "task first"    -> batch instructions before the source (nothing reusable after the first line)
+# Calls go through the production client (same host, keep_alive, window and JSON schema as model_router's
+# generation calls); only the answer is cut to one token.
+MODEL = TIER_MODELS["large"]
+NUM_CTX = generation_num_ctx(MODEL)  # A different num_ctx would reload the model (and drop its cache)
+BATCHES = [(d, t) for d in ["easy", "medium", "hard"]
+           for t in ["normal_multiple", "statement_verification", "statement_counting"]]
+Q_COUNT = 3
+
+bench_llm = get_llm(MODEL, llm.temperature, num_ctx=NUM_CTX).bind(
+    format=GeneratedQuizBatch.model_json_schema(),
+    options={"num_ctx": NUM_CTX, "num_predict": 1, "temperature": llm.temperature},
+)
+
+def build_task_first_prompt(payload: TopicPayload, difficulty: str, q_type: str, q_count: int) -> str:
+    return f"""
+    TASK: Generate exactly {q_count} questions of type '{q_type}'. DIFFICULTY: {difficulty.upper()}
+    STRICT FORMATTING RULES:
+    {build_single_type_instruction(q_type, difficulty, q_count)}
+
+    You are a Professor creating Exam Questions.
+    TOPIC: {payload.topicName}
+    SOURCE MATERIAL:
+    {payload.topicContent}
+
+    Return a JSON object containing a list of questions.
+    """
+
+# --- 2. MEASUREMENT ---
+def prompt_eval(prompt: str) -> dict:
+    # num_predict=1: we only care about the prompt-processing phase
+    metadata = bench_llm.invoke(prompt).response_metadata
+    return {
+        "tokens": metadata.get("prompt_eval_count") or 0,  # Only tokens that were NOT served from cache
+        "seconds": (metadata.get("prompt_eval_duration") or 0) / 1e9,
+    }
+
+def flush_cache():
+    # An unrelated prompt evicts the previous prefix from the slot
+    prompt_eval("Say OK.")
+
+def run_layout(name: str, prompts: list) -> dict:
+    flush_cache()
+    results = [prompt_eval(p) for p in prompts]
+    # The first call always pays for the full prompt; the rest show the reuse
+    warm = results[1:]
+    summary = {
+        "layout": name,
+        "shared": shared_fraction(prompts),
+        "first_s": results[0]["seconds"],
+        "warm_median_s": statistics.median(r["seconds"] for r in warm),
+        "warm_tokens": statistics.median(r["tokens"] for r in warm),
+        "total_s": sum(r["seconds"] for r in results),
+    }
+    print(f"   {name:<14} shared {summary['shared']:6.1%} | first {summary['first_s']:.2f}s | "
+          f"warm median {summary['warm_median_s']:.2f}s ({summary['warm_tokens']:.0f} tokens evaluated) | "
+          f"total {summary['total_s']:.2f}s")
+    return summary
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open("data/ai_list_split.json", "r", encoding="utf-8") as f:
+        topics = json.load(f)
+    # Longest section = where prompt evaluation hurts the most
+    topic = max(topics, key=lambda t: len(t["content"]))
+    payload = TopicPayload(topicName=topic["title"], topicContent=topic["content"], quiz_config=[])
+    print(f"🔬 '{topic['title']}' ({len(topic['content'])} chars), {len(BATCHES)} batches on {MODEL}")
+
+    prompt_eval("Say OK.")  # Load the model so load time doesn't pollute the first measurement
+
+    task_first = run_layout("task first", [build_task_first_prompt(payload, d, t, Q_COUNT) for d, t in BATCHES])
+    shared = run_layout("shared prefix", [build_batch_prompt(payload, d, t, Q_COUNT) for d, t in BATCHES])
+
+    saved = task_first["total_s"] - shared["total_s"]
+    print(f"\n⚡ Shared prefix saves {saved:.2f}s of prompt evaluation per topic "
+          f"({saved / task_first['total_s']:.0%}).")
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import select
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pydantic import BaseModel
+from llm_client import get_llm
+from llm_scheduler import INTERACTIVE, LLMScheduler
+from ollama_pool import UpstreamPool
+
+# --- 1. CONFIGURATION ---
+# Checks ollama_pool.py without GPUs: every "host" is a local HTTP server speaking just enough of
+# the Ollama API (/api/tags, /api/ps, streaming /api/chat), with a latency we can change at runtime.
+MODEL = "qwen2.5:14b"
+HEALTH_DELAY = 0.5   # Each stand-in answers health checks this slowly (the event loop must not notice)
+CALL_DELAY = 0.05
+
+class Answer(BaseModel):
+    host: int
+
+# --- 2. STAND-IN OLLAMA HOST ---
+class StandIn:
+    def __init__(self, port: int, models, loaded, log: list):
+        self.port, self.delay, self.log = port, CALL_DELAY, log
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(HEALTH_DELAY)
+                names = {"/api/tags": models, "/api/ps": loaded}.get(self.path)
+                if names is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self._json({"models": [{"name": name} for name in names]})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.log.append((stand_in.port, "start"))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    end = time.time() + stand_in.delay
+                    while time.time() < end:  # "Generating": stop when the client hangs up
+                        time.sleep(0.02)
+                        readable, _, _ = select.select([self.connection], [], [], 0)
+                        if readable and self.connection.recv(1, socket.MSG_PEEK) == b"":
+                            raise ConnectionResetError
+                    content = json.dumps({"host": stand_in.port})
+                    for chunk in ({"message": {"role": "assistant", "content": content}, "done": False},
+                                  {"message": {"role": "assistant", "content": ""}, "done": True,
+                                   "done_reason": "stop", "eval_count": 1, "prompt_eval_count": 1}):
+                        chunk.update(model=request["model"], created_at="2024-01-01T00:00:00Z")
+                        self.wfile.write((json.dumps(chunk) + "\n").encode())
+                        self.wfile.flush()
+                    stand_in.log.append((stand_in.port, "done"))
+                except (BrokenPipeError, ConnectionResetError):
+                    stand_in.log.append((stand_in.port, "aborted"))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+# --- 3. CHECKS ---
+def make_pool(urls, scheduler: LLMScheduler) -> UpstreamPool:
+    pool = UpstreamPool(urls, hedge_slot=lambda: scheduler.aslot("standin", INTERACTIVE))
+    pool.runner = pool.runnable(MODEL, lambda url: get_llm(MODEL, 0.0, base_url=url).bind(
+        format=Answer.model_json_schema()))
+    return pool
+
+async def call(pool: UpstreamPool, scheduler: LLMScheduler, prompt: str) -> int:
+    async with scheduler.aslot("standin", INTERACTIVE):
+        return Answer.model_validate_json((await pool.runner.ainvoke(prompt)).content).host
+
+async def check_first_call_does_not_block(pool, scheduler) -> float:
+    """Longest event-loop stall while the first call waits for the first round of health checks."""
+    stalls = []
+
+    async def ticker():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stalls.append(now - last - 0.01)
+            last = now
+
+    tick = asyncio.ensure_future(ticker())
+    await call(pool, scheduler, "warm-up")
+    tick.cancel()
+    return max(stalls)
+
+async def check_affinity(pool, scheduler, log) -> dict:
+    """Sequential calls for three topics: each topic should always land on one host."""
+    log.clear()
+    homes = {}
+    for topic in ["Builder Pattern", "Observer Pattern", "Dependency Injection"] * 3:
+        prefix = f"You are a Professor.\nTOPIC: {topic}\nSOURCE MATERIAL:\n" + topic * 200
+        homes.setdefault(topic, set()).add(await call(pool, scheduler, prefix + "\nTASK: 3 questions"))
+    return homes
+
+async def check_spread(pool, scheduler, log) -> Counter:
+    log.clear()
+    await asyncio.gather(*[call(pool, scheduler, f"independent prompt {i}") for i in range(6)])
+    return Counter(port for port, event in log if event == "start")
+
+async def check_hedge(pool, scheduler, hosts, log) -> tuple:
+    """The prompt's home host turns slow: the duplicate elsewhere must take its own scheduler slot."""
+    prompt = "hedge me"
+    home = await call(pool, scheduler, prompt)  # Idle pool: the prompt's home host answers
+    slow = next(h for h in hosts if h.port == home)
+    for _ in range(25):
+        pool.latencies[MODEL].append(CALL_DELAY)
+    slow.delay = 5.0
+    log.clear()
+    admitted = scheduler.counters["admitted_interactive"]
+    start = time.perf_counter()
+    winner = await call(pool, scheduler, prompt)
+    seconds = time.perf_counter() - start
+    await asyncio.sleep(0.2)  # Let the loser's connection close
+    slow.delay = CALL_DELAY
+    slots = scheduler.counters["admitted_interactive"] - admitted
+    return slow, winner, seconds, slots, list(log)
+
+# --- MAIN ---
+if __name__ == "__main__":
+    log = []
+    hosts = [StandIn(port, [MODEL], [MODEL], log) for port in (18101, 18102, 18103)]
+    scheduler = LLMScheduler(max_in_flight=8)
+    pool = make_pool([h.url for h in hosts], scheduler)
+
+    async def main():
+        stall = await check_first_call_does_not_block(pool, scheduler)
+        print(f"{'✅' if stall < HEALTH_DELAY / 2 else '❌'} First call waited for health checks "
+              f"off the loop (longest stall {stall * 1000:.0f} ms, checks take {HEALTH_DELAY * 1000:.0f} ms/host)")
+
+        homes = await check_affinity(pool, scheduler, log)
+        print(f"{'✅' if all(len(h) == 1 for h in homes.values()) else '❌'} Prefix affinity: "
+              + ", ".join(f"{topic} -> {sorted(h)}" for topic, h in homes.items()))
+
+        spread = await check_spread(pool, scheduler, log)
+        print(f"{'✅' if len(spread) > 1 else '❌'} Burst of 6 spread over hosts: {dict(spread)}")
+
+        slow, winner, seconds, slots, events = await check_hedge(pool, scheduler, hosts, log)
+        ok = winner != slow.port and slots == 2 and (slow.port, "aborted") in events
+        print(f"{'✅' if ok else '❌'} Hedge: answer from {winner} in {seconds:.2f}s, "
+              f"{slots} scheduler slots taken, events {events}")
+        print(f"📊 Pool stats: {dict(pool.stats)} | scheduler: {scheduler.metrics()['admitted_interactive']} admitted")
+
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Iterable, Optional, Type
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+from llm_client import get_llm, get_structured_llm
+
+# --- 1. CONFIGURATION ---
+# Ollama reloads a model whenever num_ctx changes, so we only use a few fixed buckets.
+NUM_CTX_BUCKETS = [2048, 4096, 8192, 16384, 32768]
+
+# Largest window we allow per model family (bounded by model support and host KV-cache memory)
+MAX_NUM_CTX = {
+    "llama3": 8192,
+    "qwen2.5": 32768,
+}
+
+# Local tokenizers matching each Ollama model family (downloaded once from the HF hub)
+TOKENIZER_REPOS = {
+    "llama3": "NousResearch/Meta-Llama-3-8B-Instruct",  # Ungated copy of the Llama 3 tokenizer
+    "qwen2.5": "Qwen/Qwen2.5-14B-Instruct",
+}
+
+CHAT_TEMPLATE_OVERHEAD = 32  # Role markers etc. around a single user message
+USAGE_LOG_FILE = "data/token_usage.jsonl"
+
+class PromptBudgetExceeded(Exception):
+    pass
+
+@dataclass
+class CallBudget:
+    model: str
+    prompt_tokens: int
+    output_tokens: int
+    num_ctx: int
+    fits: bool
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+# --- 2. TOKEN COUNTING ---
+def model_family(model: str) -> str:
+    return model.split(":")[0]
+
+@lru_cache(maxsize=None)
+def _load_tokenizer(family: str):
+    repo = TOKENIZER_REPOS.get(family)
+    if repo is None:
+        print(f"⚠️  No tokenizer configured for '{family}', falling back to a chars/3 estimate.")
+        return None
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(repo)
+    except Exception as e:
+        print(f"⚠️  Could not load tokenizer '{repo}' ({e}), falling back to a chars/3 estimate.")
+        return None
+
+@lru_cache(maxsize=256)  # Batches count each prompt twice: once to size the job, once per call
+def count_tokens(text: str, model: str) -> int:
+    tokenizer = _load_tokenizer(model_family(model))
+    if tokenizer is None:
+        return len(text) // 3  # Deliberately pessimistic: better a bigger bucket than truncation
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def max_num_ctx(model: str) -> int:
+    return MAX_NUM_CTX.get(model_family(model), NUM_CTX_BUCKETS[0])
+
+def max_prompt_tokens(model: str, expected_output_tokens: int) -> int:
+    """How much prompt fits in the model's largest window (use this to size chunks when splitting)."""
+    return max_num_ctx(model) - expected_output_tokens - CHAT_TEMPLATE_OVERHEAD
+
+# --- 3. BUDGETING ---
+def plan_call(model: str, prompt: str, expected_output_tokens: int) -> CallBudget:
+    """Smallest num_ctx bucket that holds prompt + expected output."""
+    prompt_tokens = count_tokens(prompt, model) + CHAT_TEMPLATE_OVERHEAD
+    needed = prompt_tokens + expected_output_tokens
+    limit = max_num_ctx(model)
+
+    for bucket in NUM_CTX_BUCKETS:
+        if bucket > limit:
+            break
+        if needed <= bucket:
+            return CallBudget(model, prompt_tokens, expected_output_tokens, bucket, True)
+
+    return CallBudget(model, prompt_tokens, expected_output_tokens, limit, False)
+
+def job_num_ctx(model: str, prompts: Iterable[str], expected_output_tokens: int) -> int:
+    """
+    One window for a whole batch: the bucket of its largest prompt. Ollama reloads the model whenever
+    num_ctx changes, so calls that run side by side must all use the same value.
+    """
+    return max((plan_call(model, prompt, expected_output_tokens).num_ctx for prompt in prompts),
+               default=NUM_CTX_BUCKETS[0])
+
+_usage_lock = threading.Lock()
+
+def record_usage(budget: CallBudget, task: str):
+    """Appends one line per call for capacity planning."""
+    entry = {
+        "timestamp": time.time(),
+        "task": task,
+        "model": budget.model,
+        "prompt_tokens": budget.prompt_tokens,
+        "expected_output_tokens": budget.output_tokens,
+        "num_ctx": budget.num_ctx,
+        "fits": budget.fits,
+    }
+    with _usage_lock:
+        os.makedirs(os.path.dirname(USAGE_LOG_FILE) or ".", exist_ok=True)
+        with open(USAGE_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+def check_budget(model: str, prompt: str, expected_output_tokens: int, task: str,
+                 num_ctx: Optional[int] = None, strict: bool = True) -> CallBudget:
+    """
+    Budget of one call that is about to be sent (recorded): its own bucket, or `num_ctx` when the caller
+    runs a fixed window. Over budget raises PromptBudgetExceeded (strict=False only warns).
+    """
+    budget = plan_call(model, prompt, expected_output_tokens)
+    if num_ctx is not None and budget.fits:
+        budget = replace(budget, num_ctx=num_ctx, fits=budget.total_tokens <= num_ctx)
+    record_usage(budget, task)
+    if not budget.fits:
+        message = (f"{task}: {budget.total_tokens} tokens needed, {model} runs with num_ctx={budget.num_ctx}. "
+                   f"Split the input into pieces of <= "
+                   f"{budget.num_ctx - expected_output_tokens - CHAT_TEMPLATE_OVERHEAD} prompt tokens.")
+        if strict:
+            raise PromptBudgetExceeded(message)
+        print(f"⚠️  {message} (input will be truncated by Ollama)")
+    return budget
+
+# --- 4. BUDGETED RUNNABLE ---
+def budgeted_structured_llm(model: str, schema: Type[BaseModel], temperature: float = 0.0,
+                            expected_output_tokens: int = 2048, task: Optional[str] = None,
+                            strict: bool = True, num_ctx: Optional[int] = None):
+    """
+    Drop-in for get_structured_llm(get_llm(...), schema): every prompt is counted and sent with
+    `num_ctx` (pass job_num_ctx(...) for batches) or, for one-off calls, the smallest adequate bucket.
+    Over-budget prompts raise PromptBudgetExceeded so the caller splits the input
+    (strict=False sends them at the model maximum with a warning instead).
+    """
+    task = task or schema.__name__
+
+    def _select(prompt):
+        budget = check_budget(model, prompt if isinstance(prompt, str) else str(prompt), expected_output_tokens,
+                              task, num_ctx, strict)
+        return get_structured_llm(get_llm(model, temperature, num_ctx=budget.num_ctx), schema)
+
+    def _invoke(prompt, config):
+        return _select(prompt).invoke(prompt, config)
+
+    async def _ainvoke(prompt, config):
+        return await _select(prompt).ainvoke(prompt, config)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=f"budgeted_{schema.__name__}")
@@ -0,0 +1,31 @@
+import os
+from typing import List
+
+# --- 1. PREFIX-FIRST LAYOUT ---
+# Ollama keeps the KV cache of the previous prompt and only re-evaluates from the first token
+# that differs. So every batch for a topic should start with the SAME bytes (role, rules, source)
+# and put what changes (type, difficulty, count, already-generated items) at the very end.
+# Anything variable before the source material forces the whole source to be re-evaluated.
+# Note: num_ctx must also stay the same between calls, otherwise Ollama reloads the model.
+
+def shared_prefix(*blocks: str) -> str:
+    """Invariant part of the prompt. Blocks are stripped and joined deterministically."""
+    return "\n\n".join(block.strip() for block in blocks if block and block.strip())
+
+def source_block(title: str, content: str) -> str:
+    return f"TOPIC: {title}\nSOURCE MATERIAL:\n{content.strip()}"
+
+def assemble_prompt(prefix: str, task: str) -> str:
+    """prefix (byte-identical across batches) + per-call task."""
+    return f"{prefix}\n\n{task.strip()}\n"
+
+# --- 2. DIAGNOSTICS ---
+def common_prefix_chars(prompts: List[str]) -> int:
+    return len(os.path.commonprefix(prompts)) if prompts else 0
+
+def shared_fraction(prompts: List[str]) -> float:
+    """Share of the average prompt that the cache can reuse after the first call."""
+    if not prompts:
+        return 0.0
+    avg_len = sum(len(p) for p in prompts) / len(prompts)
+    return common_prefix_chars(prompts) / avg_len if avg_len else 0.0
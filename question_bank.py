@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from poc_16_gen_quiz_v2_loop_type import (
+    FinalQuizOutput, GeneratedQuizBatch, QuizQuestion, TopicPayload, build_batch_prompt, llm,
+)
+from embedding_dedup import DedupGuard, question_key
+from fact_bank import with_facts
+from llm_scheduler import INTERACTIVE, request_context, scheduler as llm_scheduler
+from model_router import generate_routed
+
+# --- 1. CONFIGURATION ---
+# Previews are served from a pool of already validated questions per (topic, difficulty, type).
+# Generation happens in the background whenever a pool runs low for the instructor asking.
+BANK_FILE = os.getenv("QUESTION_BANK_FILE", "data/question_bank.sqlite")
+LOW_WATER = 5            # Refill when fewer unseen questions than this are left
+REFILL_BATCH = 6         # Questions generated per refill job
+MAX_WORKERS = 2          # Background refill jobs (shares Ollama with live requests)
+AVOID_LIST_SIZE = 30     # Existing questions shown to the model so refills don't repeat them
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+# --- 2. THE BANK ---
+class QuestionBank:
+    """
+    Pool = (topic_id, hash of topicContent, difficulty, type); an edited topic starts a new pool.
+    Served questions are recorded per instructor, so the same instructor never gets a repeat.
+    """
+
+    def __init__(self, path: str = BANK_FILE, low_water: int = LOW_WATER,
+                 refill_batch: int = REFILL_BATCH, max_workers: int = MAX_WORKERS):
+        self.path = path
+        self.low_water = low_water
+        self.refill_batch = refill_batch
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="question-bank")
+        self._refilling: Dict[Tuple, Future] = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic_id INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pool ON questions(topic_id, content_hash, difficulty, type)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS served (
+                    instructor_id INTEGER NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    served_at REAL NOT NULL,
+                    PRIMARY KEY (instructor_id, question_id)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    # Storage
+    def add(self, pool: Tuple, questions: List[QuizQuestion]) -> List[int]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            return [
+                conn.execute(
+                    "INSERT INTO questions (topic_id, content_hash, difficulty, type, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (*pool, q.model_dump_json(), now),
+                ).lastrowid
+                for q in questions
+            ]
+
+    def take(self, pool: Tuple, count: int, instructor_id: int) -> List[QuizQuestion]:
+        """Up to `count` questions this instructor hasn't seen (oldest first), marked as served."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("""
+                SELECT id, payload FROM questions
+                WHERE topic_id = ? AND content_hash = ? AND difficulty = ? AND type = ?
+                  AND id NOT IN (SELECT question_id FROM served WHERE instructor_id = ?)
+                ORDER BY id LIMIT ?
+            """, (*pool, instructor_id, count)).fetchall()
+            self._mark_served(conn, instructor_id, [row[0] for row in rows])
+        return [QuizQuestion.model_validate_json(payload) for _, payload in rows]
+
+    def mark_served(self, instructor_id: int, question_ids: List[int]):
+        with self._lock, self._connect() as conn:
+            self._mark_served(conn, instructor_id, question_ids)
+
+    @staticmethod
+    def _mark_served(conn: sqlite3.Connection, instructor_id: int, question_ids: List[int]):
+        now = time.time()
+        conn.executemany(
+            "INSERT OR IGNORE INTO served (instructor_id, question_id, served_at) VALUES (?, ?, ?)",
+            [(instructor_id, qid, now) for qid in question_ids],
+        )
+
+    def available(self, pool: Tuple, instructor_id: int) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM questions
+                WHERE topic_id = ? AND content_hash = ? AND difficulty = ? AND type = ?
+                  AND id NOT IN (SELECT question_id FROM served WHERE instructor_id = ?)
+            """, (*pool, instructor_id)).fetchone()[0]
+
+    def recent_questions(self, pool: Tuple, limit: int = AVOID_LIST_SIZE) -> List[QuizQuestion]:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("""
+                SELECT payload FROM questions
+                WHERE topic_id = ? AND content_hash = ? AND difficulty = ? AND type = ?
+                ORDER BY id DESC LIMIT ?
+            """, (*pool, limit)).fetchall()
+        return [QuizQuestion.model_validate_json(payload) for (payload,) in rows]
+
+    # Generation
+    def _generate(self, payload: TopicPayload, pool: Tuple, count: int) -> List[QuizQuestion]:
+        _, _, difficulty, q_type = pool
+        avoid = self.recent_questions(pool)
+        payload = with_facts(payload)  # The pool stays keyed on the raw text; only the prompt changes
+        return generate_routed(
+            f"quiz/{q_type}", difficulty, GeneratedQuizBatch, "questions",
+            lambda n, existing: build_batch_prompt(payload, difficulty, q_type, n, avoid + existing),
+            target=count, temperature=llm.temperature, label=f"bank {difficulty}/{q_type}",
+            fresh=True,  # The pool needs NEW questions, never a cached batch
+            dedup=DedupGuard(question_key, [question_key(q) for q in avoid]),
+        )
+
+    def schedule_refill(self, payload: TopicPayload, pool: Tuple) -> Optional[Future]:
+        """At most one refill in flight per pool."""
+        with self._lock:
+            running = self._refilling.get(pool)
+            if running is not None and not running.done():
+                return running
+            future = self._executor.submit(self._refill, payload, pool)
+            self._refilling[pool] = future
+            return future
+
+    def _refill(self, payload: TopicPayload, pool: Tuple):
+        start_time = time.time()
+        questions = self._generate(payload, pool, self.refill_batch)
+        self.add(pool, questions)
+        print(f"   🔄 Refilled {pool[2]}/{pool[3]} for topic {pool[0]}: +{len(questions)} "
+              f"({time.time() - start_time:.1f}s)")
+        return len(questions)
+
+    # Preview entry point (POST /quizzes/preview)
+    def serve_preview(self, topic_id: int, payload: TopicPayload, instructor_id: int) -> List[dict]:
+        """
+        Same output as generate_quiz_for_topic. Served from the pool; only a cold pool
+        generates synchronously (and those questions are stored, so the next preview is warm).
+        Cold generation runs as interactive LLM work; refills stay background.
+        """
+        digest = content_hash(payload.topicContent)
+        # Cold pools need the LLM: refuse (503 + Retry-After) before anything is marked as served
+        if any(self.available((topic_id, digest, config.difficulty, type_req.type), instructor_id) < type_req.number
+               for config in payload.quiz_config for type_req in config.quiz_type_config):
+            llm_scheduler.admit(INTERACTIVE)
+
+        final_results = []
+        for config in payload.quiz_config:
+            aggregated_questions = []
+            for type_req in config.quiz_type_config:
+                pool = (topic_id, digest, config.difficulty, type_req.type)
+                questions = self.take(pool, type_req.number, instructor_id)
+
+                shortfall = type_req.number - len(questions)
+                if shortfall > 0:
+                    print(f"   🥶 {config.difficulty}/{type_req.type}: pool short by {shortfall}, generating now...")
+                    with request_context(instructor_id, INTERACTIVE):
+                        fresh_questions = self._generate(payload, pool, shortfall)
+                    self.mark_served(instructor_id, self.add(pool, fresh_questions))
+                    questions += fresh_questions
+
+                if self.available(pool, instructor_id) < self.low_water:
+                    self.schedule_refill(payload, pool)
+                aggregated_questions.extend(questions)
+
+            for global_id, q in enumerate(aggregated_questions, start=1):
+                q.id = global_id
+
+            final_quiz = FinalQuizOutput(
+                topic_title=payload.topicName,
+                difficulty=config.difficulty,
+                questions=aggregated_questions
+            )
+            final_results.append(final_quiz.dict())
+        return final_results
+
+    def warm_up(self, topic_id: int, payload: TopicPayload) -> List[Future]:
+        """Fill every requested pool ahead of time (e.g. right after a course is saved)."""
+        digest = content_hash(payload.topicContent)
+        return [
+            self.schedule_refill(payload, (topic_id, digest, config.difficulty, type_req.type))
+            for config in payload.quiz_config
+            for type_req in config.quiz_type_config
+        ]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open("data/ai_list_split.json", "r", encoding="utf-8") as f:
+        topic = json.load(f)[3]
+
+    payload = TopicPayload(
+        topicName=topic["title"],
+        topicContent=topic["content"],
+        quiz_config=[{"difficulty": "medium", "quiz_type_config": [
+            {"type": "normal_multiple", "number": 2},
+            {"type": "statement_verification", "number": 2},
+        ]}],
+    )
+
+    bank = QuestionBank(path="data/question_bank_demo.sqlite")
+    for job in bank.warm_up(topic_id=4, payload=payload):
+        job.result()
+
+    for attempt in range(2):
+        start_time = time.time()
+        result = bank.serve_preview(topic_id=4, payload=payload, instructor_id=1)
+        print(f"⚡ Preview {attempt + 1}: {sum(len(q['questions']) for q in result)} questions "
+              f"in {time.time() - start_time:.2f}s")
+    bank.shutdown()
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import re
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Hashable, List
+from embedding_dedup import DedupGuard, question_key
+from fact_bank import with_facts
+from llm_client import astream_json, get_llm
+from llm_scheduler import INTERACTIVE, request_context, scheduler as llm_scheduler
+from model_router import FALLBACK_RETRIES, ITEM_OUTPUT_TOKENS, generation_num_ctx, record_route, route
+from output_repair import repair_stats, validate_item
+from prompt_budget import PromptBudgetExceeded, check_budget
+from poc_16_gen_quiz_v2_loop_type import (
+    MAX_CONCURRENCY, GeneratedQuizBatch, QuizQuestion, TopicPayload, build_batch_prompt, llm,
+)
+
+# --- 1. INCREMENTAL JSON PARSER ---
+class QuestionStreamParser:
+    """
+    Pulls complete question objects out of a partially received {"questions": [...]} document.
+    Call feed() with every streamed text chunk; it returns the objects that closed in that chunk.
+    """
+
+    _ARRAY_START = re.compile(r'"questions"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ""
+        self.scan_pos = None   # None until the questions array has started
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = 0
+
+    def feed(self, text: str) -> List[dict]:
+        self.buffer += text
+        if self.scan_pos is None:
+            match = self._ARRAY_START.search(self.buffer)
+            if not match:
+                return []
+            self.scan_pos = match.end()
+
+        completed = []
+        for i in range(self.scan_pos, len(self.buffer)):
+            ch = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.object_start = i
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        completed.append(json.loads(self.buffer[self.object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+        self.scan_pos = len(self.buffer)
+        return completed
+
+# --- 2. STREAMING GENERATOR ---
+# Same calls as the batch path (model_router's model and window, scheduler slot, upstream pool, item repair,
+# near-duplicate screening, top-ups for the shortfall), but each response is read token by token.
+MAX_RETRIES = 2  # Top-up calls on the last tier, like the batch path's salvage retries
+
+def to_preview_item(topic_id: int, difficulty: str, question: QuizQuestion) -> dict:
+    """A QuizQuestion in the QuizPreviewResponse.generated_questions item format."""
+    return {
+        "topic_id": topic_id,
+        "question_text": question.question_text,
+        "question_type": question.type.upper(),
+        "difficulty": difficulty.upper(),
+        "explanation": question.explanation,
+        "choices": [
+            {"choice_text": option.text, "is_correct": option.id == question.correct_option_id}
+            for option in question.options
+        ],
+    }
+
+async def astream_quiz_for_topic(payload: TopicPayload, topic_id: int, max_concurrency: int = MAX_CONCURRENCY,
+                                 user_id: Hashable = "anonymous") -> AsyncIterator[dict]:
+    """
+    Yields events as soon as they are ready (the /quizzes/preview/stream contract):
+      {"event": "question", "topic_id": ..., <QuizPreviewResponse.generated_questions item fields>}
+      {"event": "error", "topic_id": ..., "difficulty": ..., "type": ..., "message": ...}
+      {"event": "done", "topic_id": ..., "counts": {difficulty: n}}
+    """
+    llm_scheduler.admit(INTERACTIVE)  # Raised on the first iteration, before any event -> 503 + Retry-After
+    payload = with_facts(payload)
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    dedup = DedupGuard(question_key)  # Shared by all batches of the topic, like the batch path
+
+    async def stream_attempt(model: str, prompt: str, difficulty: str, q_count: int, emitted: List[QuizQuestion]):
+        """One call: every question that validates and isn't a near-duplicate is emitted as it closes."""
+        parser = QuestionStreamParser()
+        async for text in astream_json(get_llm(model, llm.temperature, num_ctx=generation_num_ctx(model)),
+                                       GeneratedQuizBatch, prompt):
+            for raw in parser.feed(text):
+                question, _ = validate_item(raw, QuizQuestion)
+                if question is None or len(emitted) >= q_count:
+                    continue  # Skip the broken one, keep streaming the rest
+                screened = await dedup.ascreen([question])
+                dedup.admit(screened, screened)
+                if screened:
+                    emitted.append(question)
+                    await queue.put({"event": "question", "difficulty": difficulty, "question": question})
+
+    async def stream_on_tier(model: str, last: bool, difficulty: str, q_type: str, q_count: int,
+                             emitted: List[QuizQuestion]) -> bool:
+        """Calls on one model until the batch is complete or out of retries. False: nothing was sent."""
+        for attempt in range((MAX_RETRIES if last else FALLBACK_RETRIES) + 1):
+            missing = q_count - len(emitted)
+            if missing <= 0:
+                break
+            prompt = build_batch_prompt(payload, difficulty, q_type, missing, emitted)
+            try:
+                check_budget(model, prompt, missing * ITEM_OUTPUT_TOKENS, f"quiz/{q_type}", generation_num_ctx(model))
+            except PromptBudgetExceeded:
+                if last:
+                    raise
+                return attempt > 0  # Too long for this model's window: the next tier gets the rest
+            if attempt > 0:
+                repair_stats.record("retry")
+            try:
+                await stream_attempt(model, prompt, difficulty, q_count, emitted)
+            except Exception as e:
+                print(f"     ⚠️ stream {difficulty}/{q_type} @{model}: attempt {attempt+1} failed: {e}")
+        return True
+
+    async def run_batch(difficulty: str, q_type: str, q_count: int):
+        task = f"quiz/{q_type}"
+        emitted: List[QuizQuestion] = []
+        try:
+            with request_context(user_id, INTERACTIVE):  # This task's own context: its calls queue as the user
+                async with semaphore:
+                    models = route(task, difficulty)
+                    for i, model in enumerate(models):
+                        last = i == len(models) - 1
+                        start = time.perf_counter()
+                        if not await stream_on_tier(model, last, difficulty, q_type, q_count, emitted):
+                            continue
+                        ok = len(emitted) >= q_count
+                        record_route(task, difficulty, model, time.perf_counter() - start, ok)
+                        if ok:
+                            break
+                        if not last:
+                            repair_stats.record("retry")  # The next tier streams the shortfall
+        except Exception as e:
+            await queue.put({"event": "error", "topic_id": topic_id, "difficulty": difficulty, "type": q_type,
+                             "message": str(e)})
+
+    tasks = [
+        asyncio.create_task(run_batch(config.difficulty, type_req.type, type_req.number))
+        for config in payload.quiz_config
+        for type_req in config.quiz_type_config
+    ]
+
+    async def close_when_done():
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.put(None)
+
+    closer = asyncio.create_task(close_when_done())
+
+    counts = defaultdict(int)
+    try:
+        while (event := await queue.get()) is not None:
+            if event["event"] == "question":
+                counts[event["difficulty"]] += 1
+                event = {"event": "question", **to_preview_item(topic_id, event["difficulty"], event["question"])}
+            yield event
+    finally:
+        # Client went away -> stop generating
+        for task in tasks:
+            task.cancel()
+        closer.cancel()
+
+    yield {"event": "done", "topic_id": topic_id, "counts": dict(counts)}
+
+# --- 3. WIRE FORMATS ---
+def to_ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def to_sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open("data/ai_list_split.json", "r", encoding="utf-8") as f:
+        topic = json.load(f)[3]
+
+    payload = TopicPayload(
+        topicName=topic["title"],
+        topicContent=topic["content"],
+        quiz_config=[{
+            "difficulty": "medium",
+            "quiz_type_config": [
+                {"type": "normal_multiple", "number": 3},
+                {"type": "statement_verification", "number": 3},
+                {"type": "statement_counting", "number": 2},
+            ],
+        }],
+    )
+
+    async def main():
+        start_time = time.time()
+        first_at = None
+        async for event in astream_quiz_for_topic(payload, topic_id=4):
+            if event["event"] == "question" and first_at is None:
+                first_at = time.time() - start_time
+                print(f"⚡ Time to first question: {first_at:.2f}s")
+            print(to_ndjson(event), end="")
+        print(f"\n⏱️  Stream finished after {time.time() - start_time:.2f}s")
+
+    asyncio.run(main())
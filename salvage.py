@@ -0,0 +1,204 @@
+import time
+from typing import Callable, List, Optional, Tuple, Type, get_args
+from pydantic import BaseModel
+from langchain_ollama import ChatOllama
+from output_repair import repair_stats, tolerant_loads, validate_item
+from llm_cache import LLMResponseCache
+from llm_client import get_json_llm, get_response_cache
+
+# --- 1. PER-ITEM VALIDATION ---
+# with_structured_output validates the batch as a whole: one bad question and all N are lost.
+# Here the raw JSON is validated item by item, valid ones are kept and only the shortfall is retried.
+
+def item_model_of(batch_schema: Type[BaseModel], list_key: str) -> Type[BaseModel]:
+    """GeneratedQuizBatch.questions: List[QuizQuestion] -> QuizQuestion"""
+    return get_args(batch_schema.model_fields[list_key].annotation)[0]
+
+def extract_valid_items(raw_text: str, list_key: str, item_model: Type[BaseModel]) -> Tuple[List[BaseModel], int]:
+    """Returns (valid items, number rejected). Broken JSON / off-schema values are repaired first (output_repair)."""
+    data, repaired = tolerant_loads(raw_text)
+    raw_items = data.get(list_key, []) if isinstance(data, dict) else None
+    if not isinstance(raw_items, list):
+        repair_stats.record("failed")
+        return [], 0
+
+    valid = []
+    for raw in raw_items:
+        item, coerced = validate_item(raw, item_model)
+        if item is not None:
+            valid.append(item)
+            repaired = repaired or coerced
+    repair_stats.record("repaired" if repaired else "clean")
+    return valid, len(raw_items) - len(valid)
+
+def existing_items_block(items: List[BaseModel], text_field: str) -> str:
+    """Prompt section telling the model what it already produced (so the top-up doesn't repeat it)."""
+    if not items:
+        return ""
+    lines = "\n".join(f"- {getattr(item, text_field)}" for item in items)
+    return f"""
+            ALREADY GENERATED (Do NOT repeat or paraphrase these):
+            {lines}
+            """
+
+# --- 2. SALVAGE LOOP ---
+# Optional hooks:
+#   accept(item, collected) -> bool       e.g. per-type quotas when one call mixes several types
+#   on_attempt(requested, kept, seconds)  telemetry per LLM call (see batch_planner.py)
+#   on_prompt(prompt, count)              sees every prompt before it is sent, e.g. token budgeting
+#                                         (see model_router.py); raising fails that attempt
+#   dedup                                 .screen(items) / .ascreen(items) / .admit(kept, screened),
+#                                         e.g. embedding_dedup.DedupGuard; screened-out near-duplicates
+#                                         count as missing -> regenerated
+Accept = Callable[[BaseModel, List[BaseModel]], bool]
+OnAttempt = Callable[[int, int, float], None]
+OnPrompt = Callable[[str, int], None]
+
+class _Salvage:
+    """Shared bookkeeping for the sync and async loops."""
+
+    def __init__(self, llm: ChatOllama, batch_schema: Type[BaseModel], list_key: str,
+                 build_prompt: Callable[[int, List[BaseModel]], str], target: int, label: str, fresh: bool,
+                 accept: Optional[Accept] = None, on_attempt: Optional[OnAttempt] = None, dedup=None,
+                 on_prompt: Optional[OnPrompt] = None):
+        self.batch_schema = batch_schema
+        self.list_key = list_key
+        self.item_model = item_model_of(batch_schema, list_key)
+        self.build_prompt = build_prompt
+        self.target = target
+        self.label = label
+        self.json_llm = get_json_llm(llm, batch_schema)
+        self.collected: List[BaseModel] = []
+
+        # Cache the complete result under the first-attempt prompt (same key space as llm_client)
+        self.cache_key = LLMResponseCache.make_key(llm.model, llm.temperature, build_prompt(target, []), batch_schema)
+        self.fresh = fresh
+        self.accept = accept
+        self.on_attempt = on_attempt
+        self.dedup = dedup
+        self.on_prompt = on_prompt
+        self.generated = False
+
+    def cached(self) -> List[BaseModel]:
+        """Items of the cached complete batch ([] when fresh or not cached)."""
+        if self.fresh:
+            return []
+        hit = get_response_cache().get(self.cache_key, self.batch_schema)
+        return [] if hit is None else getattr(hit, self.list_key)
+
+    def use_cache(self, items: List[BaseModel], candidates: Optional[List[BaseModel]] = None):
+        """A cached batch still goes through accept/dedup; whatever gets dropped is regenerated."""
+        if items:
+            kept, duplicates = self.keep(items, candidates)
+            if duplicates:
+                print(f"     ♻️ {self.label}: cache hit, {duplicates} near-duplicate(s) to replace")
+
+    @property
+    def missing(self) -> int:
+        return self.target - len(self.collected)
+
+    def next_prompt(self) -> str:
+        prompt = self.build_prompt(self.missing, self.collected)
+        if self.on_prompt is not None:
+            self.on_prompt(prompt, self.missing)
+        return prompt
+
+    async def ascreen(self, items: List[BaseModel]) -> List[BaseModel]:
+        """dedup screening for the async loop: embeddings are computed off the event loop."""
+        return await self.dedup.ascreen(items) if self.dedup is not None else items
+
+    def keep(self, items: List[BaseModel], candidates: Optional[List[BaseModel]] = None) -> Tuple[int, int]:
+        """Returns (kept, dropped as near-duplicates). candidates: items already screened (ascreen)."""
+        if candidates is None:
+            candidates = self.dedup.screen(items) if self.dedup is not None else items
+        kept = []
+        for item in candidates:
+            if self.missing == 0:
+                break
+            if self.accept is None or self.accept(item, self.collected):
+                self.collected.append(item)
+                kept.append(item)
+        if self.dedup is not None:
+            self.dedup.admit(kept, candidates)
+        return len(kept), len(items) - len(candidates)
+
+    def parse(self, raw_text: str) -> Tuple[List[BaseModel], int]:
+        return extract_valid_items(raw_text, self.list_key, self.item_model)
+
+    def absorb(self, attempt: int, valid: List[BaseModel], rejected: int, seconds: float,
+               candidates: Optional[List[BaseModel]] = None):
+        requested = self.missing
+        self.generated = True
+        kept, duplicates = self.keep(valid, candidates)
+        self.report(requested, kept, seconds)
+        note = f", {rejected} rejected" if rejected else ""
+        note += f", {duplicates} near-duplicate" if duplicates else ""
+        print(f"     {'✅' if self.missing == 0 else '🩹'} {self.label}: attempt {attempt+1} kept {kept}{note} "
+              f"({len(self.collected)}/{self.target})")
+
+    def report(self, requested: int, kept: int, seconds: float):
+        if self.on_attempt is not None:
+            self.on_attempt(requested, kept, seconds)
+
+    def finish(self) -> List[BaseModel]:
+        if self.missing == 0:
+            if self.generated:
+                get_response_cache().put(self.cache_key, self.batch_schema.model_construct(**{self.list_key: self.collected}))
+        elif self.collected:
+            print(f"     ⚠️ {self.label}: returning {len(self.collected)}/{self.target} after retries.")
+        else:
+            print(f"     ❌ Skipping {self.label} due to repeated errors.")
+        return self.collected
+
+def generate_with_salvage(llm: ChatOllama, batch_schema: Type[BaseModel], list_key: str,
+                          build_prompt: Callable[[int, List[BaseModel]], str], target: int,
+                          label: str = "batch", max_retries: int = 2, fresh: bool = False,
+                          accept: Optional[Accept] = None, on_attempt: Optional[OnAttempt] = None,
+                          dedup=None, on_prompt: Optional[OnPrompt] = None) -> List[BaseModel]:
+    """
+    build_prompt(count, existing_items) must ask for `count` NEW items and mention `existing_items`.
+    Returns up to `target` validated items.
+    """
+    state = _Salvage(llm, batch_schema, list_key, build_prompt, target, label, fresh, accept, on_attempt, dedup,
+                     on_prompt)
+    state.use_cache(state.cached())
+
+    for attempt in range(max_retries + 1):
+        if state.missing <= 0:
+            break
+        if attempt > 0:
+            repair_stats.record("retry")
+        start = time.perf_counter()
+        try:
+            raw_text = state.json_llm.invoke(state.next_prompt()).content
+            state.absorb(attempt, *state.parse(raw_text), time.perf_counter() - start)
+        except Exception as e:
+            state.report(state.missing, 0, time.perf_counter() - start)
+            print(f"     ⚠️ {label}: attempt {attempt+1} failed: {e}")
+    return state.finish()
+
+async def agenerate_with_salvage(llm: ChatOllama, batch_schema: Type[BaseModel], list_key: str,
+                                 build_prompt: Callable[[int, List[BaseModel]], str], target: int,
+                                 label: str = "batch", max_retries: int = 2, fresh: bool = False,
+                                 accept: Optional[Accept] = None, on_attempt: Optional[OnAttempt] = None,
+                                 dedup=None, on_prompt: Optional[OnPrompt] = None) -> List[BaseModel]:
+    state = _Salvage(llm, batch_schema, list_key, build_prompt, target, label, fresh, accept, on_attempt, dedup,
+                     on_prompt)
+    cached = state.cached()
+    state.use_cache(cached, await state.ascreen(cached))
+
+    for attempt in range(max_retries + 1):
+        if state.missing <= 0:
+            break
+        if attempt > 0:
+            repair_stats.record("retry")
+        start = time.perf_counter()
+        try:
+            response = await state.json_llm.ainvoke(state.next_prompt())
+            seconds = time.perf_counter() - start
+            valid, rejected = state.parse(response.content)
+            state.absorb(attempt, valid, rejected, seconds, await state.ascreen(valid))
+        except Exception as e:
+            state.report(state.missing, 0, time.perf_counter() - start)
+            print(f"     ⚠️ {label}: attempt {attempt+1} failed: {e}")
+    return state.finish()
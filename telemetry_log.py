@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+from typing import List, Optional, Tuple
+
+# --- 1. APPEND-ONLY JSONL ---
+# Route stats and batch telemetry are one JSON line per LLM call. Decisions read them constantly
+# (every route, every plan), so readers keep running aggregates and only fold in the lines
+# added since their last read instead of re-parsing the whole file each time.
+
+class TelemetryLog:
+    """
+    append() writes one entry; read_new() returns the entries added since the previous call,
+    by this process or any other. If the file was truncated or replaced, it is read again from
+    the start and reset=True tells the caller to drop its aggregates first. With tail_bytes,
+    reading from the start skips all but the last tail_bytes of the file.
+    """
+
+    def __init__(self, path: str, tail_bytes: Optional[int] = None):
+        self.path = path
+        self.tail_bytes = tail_bytes
+        self._offset = 0
+        self._inode = None
+        self._lock = threading.Lock()
+
+    def append(self, entry: dict):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def read_new(self) -> Tuple[List[dict], bool]:
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                reset = self._inode is not None
+                self._offset, self._inode = 0, None
+                return [], reset
+            reset = stat.st_ino != self._inode or stat.st_size < self._offset
+            if reset:
+                self._offset = 0
+            self._inode = stat.st_ino
+            if stat.st_size == self._offset:
+                return [], reset
+            with open(self.path, "rb") as f:
+                if self._offset == 0 and self.tail_bytes and stat.st_size > self.tail_bytes:
+                    f.seek(stat.st_size - self.tail_bytes - 1)
+                    f.readline()  # Finish the line the cut landed in
+                    self._offset = f.tell()
+                f.seek(self._offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1  # A line another process is still writing waits for the next read
+            self._offset += end
+            lines = data[:end].decode("utf-8").splitlines()
+            return [json.loads(line) for line in lines if line.strip()], reset
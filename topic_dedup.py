@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+# --- 1. CONFIGURATION ---
+INDEX_FILE = os.getenv("TOPIC_INDEX_FILE", "data/topic_index.sqlite")
+SHINGLE_SIZE = 5        # Word 5-grams
+NUM_PERM = 128
+BANDS, ROWS = 16, 8     # BANDS * ROWS == NUM_PERM -> LSH S-curve knee around ~0.7
+REUSE_THRESHOLD = 0.8   # Estimated Jaccard needed before we offer existing artifacts
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fixed seed -> signatures stay comparable across processes and restarts
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+# --- 2. MINHASH ---
+def shingles(text: str, k: int = SHINGLE_SIZE) -> set:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if len(words) < k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+@lru_cache(maxsize=256)  # A request indexes and looks up the same text (treat the result as read-only)
+def minhash_signature(text: str) -> np.ndarray:
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles(text)],
+        dtype=np.uint64,
+    )
+    if hashes.size == 0:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    # Universal hashing, one row per permutation: (a*x + b) mod p, keep 32 bits
+    permuted = ((hashes[None, :] * _PERM_A[:, None] + _PERM_B[:, None]) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=1)
+
+def estimated_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+# --- 3. THE INDEX ---
+class TopicDedupIndex:
+    """
+    MinHash/LSH index over topic raw_text, plus the artifacts already generated for each topic.
+    Lookups only compare against topics sharing at least one LSH band (sub-linear).
+    Signatures live in memory for the buckets; every change is a single-row write.
+    """
+
+    def __init__(self, path: str = INDEX_FILE):
+        self.path = path
+        self.topics: Dict[str, dict] = {}
+        self.buckets: Dict[tuple, set] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ready = False
+        self._load()
+
+    # Persistence
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS topics (
+                    topic_key TEXT PRIMARY KEY,
+                    course_id INTEGER,
+                    title TEXT NOT NULL,
+                    signature BLOB NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic_key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts ON artifacts(topic_key, kind)")
+            self._ready = True
+        return conn
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with self._connect() as conn:
+            rows = conn.execute("SELECT topic_key, course_id, title, signature FROM topics").fetchall()
+        for key, course_id, title, signature in rows:
+            self._add(key, {"course_id": course_id, "title": title,
+                            "signature": np.frombuffer(signature, dtype=np.uint64).copy()})
+
+    # Buckets
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [(b, signature[b * ROWS:(b + 1) * ROWS].tobytes()) for b in range(BANDS)]
+
+    def _add(self, key: str, topic: dict):
+        self._remove(key)
+        self.topics[key] = topic
+        for band_key in self._band_keys(topic["signature"]):
+            self.buckets[band_key].add(key)
+
+    def _remove(self, key: str):
+        old = self.topics.pop(key, None)
+        if old is None:
+            return
+        for band_key in self._band_keys(old["signature"]):
+            self.buckets[band_key].discard(key)
+
+    def index_topic(self, topic_id: int, title: str, raw_text: str, course_id: Optional[int] = None):
+        """(Re)indexes one saved topic; a no-op when its text hasn't changed."""
+        key = str(topic_id)
+        signature = minhash_signature(raw_text)
+        with self._lock:
+            current = self.topics.get(key)
+            if current is not None and np.array_equal(current["signature"], signature) and current["title"] == title:
+                return
+            course_id = course_id if course_id is not None else (current or {}).get("course_id")
+            self._add(key, {"course_id": course_id, "title": title, "signature": signature})
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO topics (topic_key, course_id, title, signature) VALUES (?, ?, ?, ?)",
+                             (key, course_id, title, signature.tobytes()))
+
+    def remove(self, topic_id: int):
+        key = str(topic_id)
+        with self._lock:
+            self._remove(key)
+            with self._connect() as conn:
+                conn.execute("DELETE FROM topics WHERE topic_key = ?", (key,))
+                conn.execute("DELETE FROM artifacts WHERE topic_key = ?", (key,))
+
+    # Course save hook (POST /courses, PUT /courses/{id}/content)
+    def index_course(self, course_id: int, topics: List[dict]):
+        """Indexes every saved TopicDetail of a course, stores its summary_note and drops deleted topics."""
+        keys = {topic_key(topic) for topic in topics}
+        removed = [key for key, t in list(self.topics.items()) if t["course_id"] == course_id and key not in keys]
+        for key in removed:
+            self.remove(key)
+        for topic in topics:
+            self.index_topic(topic["id"], topic["title"], topic["raw_text"], course_id)
+            if topic.get("summary_note"):
+                self.register_artifact(topic["id"], "summary_note", topic["summary_note"])
+        print(f"🗂️  Indexed {len(topics)} topics for course {course_id} "
+              f"({len(removed)} removed, {len(self.topics)} total)")
+
+    def register_artifact(self, topic_id: int, kind: str, payload):
+        """Records a generated artifact (e.g. 'quiz', 'deck') so a near-duplicate topic can reuse it."""
+        key = str(topic_id)
+        with self._lock, self._connect() as conn:
+            if kind == "summary_note":  # One per topic; quizzes and decks accumulate
+                conn.execute("DELETE FROM artifacts WHERE topic_key = ? AND kind = ?", (key, kind))
+            conn.execute("INSERT INTO artifacts (topic_key, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                         (key, kind, json.dumps(payload, ensure_ascii=False), time.time()))
+
+    def artifacts(self, topic_id, kind: str) -> list:
+        """Newest first (a summary_note is a single entry)."""
+        if not self._ready and not os.path.exists(self.path):
+            return []
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT payload FROM artifacts WHERE topic_key = ? AND kind = ? ORDER BY id DESC",
+                                (str(topic_id), kind)).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    # Lookup
+    def find_near_duplicates(self, raw_text: str, threshold: float = REUSE_THRESHOLD,
+                             exclude_course_id: Optional[int] = None) -> List[dict]:
+        signature = minhash_signature(raw_text)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates |= self.buckets.get(band_key, set())
+            topics = {key: self.topics[key] for key in candidates}
+
+        matches = []
+        for key, topic in topics.items():
+            if exclude_course_id is not None and topic["course_id"] == exclude_course_id:
+                continue
+            similarity = estimated_jaccard(signature, topic["signature"])
+            if similarity >= threshold:
+                matches.append({"key": key, "title": topic["title"], "course_id": topic["course_id"], "similarity": similarity})
+        return sorted(matches, key=lambda m: m["similarity"], reverse=True)
+
+    def find_reusable_artifacts(self, raw_text: str, kind: str, threshold: float = REUSE_THRESHOLD,
+                                exclude_course_id: Optional[int] = None,
+                                accept: Optional[Callable] = None) -> Optional[dict]:
+        """
+        Best near-duplicate topic that already has artifacts of `kind` (only those passing `accept`,
+        e.g. same quiz config), or None (-> generate as usual).
+        """
+        for match in self.find_near_duplicates(raw_text, threshold, exclude_course_id):
+            artifact = [a for a in self.artifacts(match["key"], kind) if accept is None or accept(a)]
+            if artifact:
+                return {**match, kind: artifact}
+        return None
+
+def topic_key(topic: dict) -> str:
+    """The topic's database id: unlike order_index it survives reordering, edits and re-saves."""
+    if topic.get("id") is None:
+        raise ValueError(f"Topic '{topic.get('title')}' has no id yet: index topics after the course is saved")
+    return str(topic["id"])
+
+# Shared by the course save hook and the generation paths
+topic_index = TopicDedupIndex()
+
+# --- MAIN ---
+if __name__ == "__main__":
+    with open("data/ai_list_split.json", "r", encoding="utf-8") as f:
+        sections = json.load(f)
+
+    topics = [{"id": 100 + i, "title": s["title"], "raw_text": s["content"], "order_index": i + 1} for i, s in enumerate(sections)]
+
+    index = TopicDedupIndex(path="data/topic_index_demo.sqlite")
+    index.index_course(1, topics)
+    index.register_artifact(topics[0]["id"], "quiz", {"note": "previously generated quiz"})
+
+    # Another instructor uploads the same chapter with slightly different extraction
+    reupload = topics[0]["raw_text"].replace("\n", " ") + " Additional instructor note."
+    match = index.find_reusable_artifacts(reupload, "quiz", exclude_course_id=2)
+    if match:
+        print(f"♻️  Reusing quiz from '{match['title']}' (course {match['course_id']}, similarity {match['similarity']:.2f})")
+    else:
+        print("🆕 No near-duplicate found, generating from scratch.")